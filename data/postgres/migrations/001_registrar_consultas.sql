@@ -0,0 +1,98 @@
+-- ====================================================================================
+-- MIGRACION 001: ESCRITURA EN LOTE (RPC registrar_consultas) + IDEMPOTENCIA
+-- ====================================================================================
+-- Es idempotente: se puede ejecutar sobre una base ya existente tantas veces como se quiera.
+-- En bases nuevas (docker-compose) se ejecuta automaticamente despues de init-webanon.sql.
+-- En bases existentes / Kubernetes:
+--   psql "$DATABASE_URL" -f data/postgres/migrations/001_registrar_consultas.sql
+
+CREATE TABLE IF NOT EXISTS idempotencia (
+    clave VARCHAR(100) PRIMARY KEY,
+    respuesta JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Hash del cuerpo enviado con la clave: una clave reutilizada con otro contenido es un conflicto
+ALTER TABLE idempotencia ADD COLUMN IF NOT EXISTS hash_payload VARCHAR(64);
+
+-- Registra varias consultas (historia + examenes + procedimientos) en una sola
+-- transaccion. Si una consulta trae "clave" y ya fue registrada, devuelve la
+-- respuesta guardada en lugar de insertar de nuevo (idempotencia). Si la clave
+-- existe pero con otro "hash" de contenido, devuelve {"conflicto_clave": true}.
+-- Las respuestas repetidas llevan "repetida": true (no son registros nuevos).
+CREATE OR REPLACE FUNCTION registrar_consultas(consultas JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    c JSONB;
+    previa JSONB;
+    previa_hash VARCHAR(64);
+    h historia_clinica;
+    v_examenes JSONB;
+    v_procedimientos JSONB;
+    v_resultado JSONB;
+    salida JSONB := '[]'::jsonb;
+BEGIN
+    FOR c IN SELECT * FROM jsonb_array_elements(consultas) LOOP
+        IF c->>'clave' IS NOT NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtext(c->>'clave'));
+            SELECT respuesta, hash_payload INTO previa, previa_hash FROM idempotencia WHERE clave = c->>'clave';
+            IF FOUND THEN
+                IF previa_hash IS DISTINCT FROM c->>'hash' THEN
+                    salida := salida || jsonb_build_array(jsonb_build_object('conflicto_clave', true));
+                ELSE
+                    salida := salida || jsonb_build_array(previa || '{"repetida": true}'::jsonb);
+                END IF;
+                CONTINUE;
+            END IF;
+        END IF;
+
+        INSERT INTO historia_clinica (id_paciente, id_doctor, fecha, edad, motivo, estado_nutricion,
+                                      antecedentes_patologicos, sintomas_presentes, signos_presenciales, tratamiento)
+        SELECT r.id_paciente, r.id_doctor, COALESCE(r.fecha, CURRENT_DATE), r.edad, r.motivo, r.estado_nutricion,
+               r.antecedentes_patologicos, r.sintomas_presentes, r.signos_presenciales, r.tratamiento
+        FROM jsonb_populate_record(NULL::historia_clinica, c->'historia') r
+        RETURNING * INTO h;
+
+        WITH ins AS (
+            INSERT INTO examenes (id_historia_clinica, nombre_examen, descripcion, valor_bajo, valor_alto,
+                                  resultado, valor, fecha_registro)
+            SELECT h.id_historia_clinica, e.nombre_examen, e.descripcion, e.valor_bajo, e.valor_alto,
+                   e.resultado, e.valor, COALESCE(e.fecha_registro, NOW())
+            FROM jsonb_populate_recordset(NULL::examenes, COALESCE(c->'examenes', '[]'::jsonb)) e
+            RETURNING *
+        )
+        SELECT COALESCE(jsonb_agg(to_jsonb(ins)), '[]'::jsonb) INTO v_examenes FROM ins;
+
+        WITH ins AS (
+            INSERT INTO procedimientos (id_historia_clinica, nombre_procedimiento, resultado, valor, fecha_registro)
+            SELECT h.id_historia_clinica, p.nombre_procedimiento, p.resultado, p.valor, COALESCE(p.fecha_registro, NOW())
+            FROM jsonb_populate_recordset(NULL::procedimientos, COALESCE(c->'procedimientos', '[]'::jsonb)) p
+            RETURNING *
+        )
+        SELECT COALESCE(jsonb_agg(to_jsonb(ins)), '[]'::jsonb) INTO v_procedimientos FROM ins;
+
+        v_resultado := jsonb_build_object(
+            'historia', to_jsonb(h),
+            'examenes', v_examenes,
+            'procedimientos', v_procedimientos
+        );
+
+        IF c->>'clave' IS NOT NULL THEN
+            INSERT INTO idempotencia (clave, respuesta, hash_payload) VALUES (c->>'clave', v_resultado, c->>'hash');
+        END IF;
+
+        salida := salida || jsonb_build_array(v_resultado);
+    END LOOP;
+
+    RETURN salida;
+END
+$$;
+
+GRANT EXECUTE ON FUNCTION registrar_consultas(JSONB) TO web_anon;
+
+GRANT ALL ON idempotencia TO web_anon;
+
+-- PostgREST recarga su cache de esquema para exponer /rpc/registrar_consultas
+NOTIFY pgrst, 'reload schema';
@@ -19,4 +19,45 @@ class Settings:
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
 
+    # Cache: "memoria" (LRU por worker) o "redis" (compartida entre workers del pod)
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memoria")
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Workers de uvicorn por pod (uvicorn lee la misma variable)
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+    # Busqueda de texto en historias clinicas
+    SEARCH_TOP_K: int = int(os.getenv("SEARCH_TOP_K", "10"))
+    SEARCH_SYNC_SECONDS: float = float(os.getenv("SEARCH_SYNC_SECONDS", "30"))
+    SEARCH_CACHE_MAX_ITEMS: int = int(os.getenv("SEARCH_CACHE_MAX_ITEMS", "1024"))
+    SEARCH_CACHE_TTL_SECONDS: float = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "5"))
+    SEARCH_PAGE_SIZE: int = int(os.getenv("SEARCH_PAGE_SIZE", "1000"))
+
+    # Generacion de PDF (pool de procesos + cache por contenido)
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "2"))
+    PDF_CACHE_MAX_ITEMS: int = int(os.getenv("PDF_CACHE_MAX_ITEMS", "256"))
+    PDF_BATCH_MAX: int = int(os.getenv("PDF_BATCH_MAX", "200"))
+
+    # Directorio replicado de doctores y admisionistas
+    DIRECTORY_SYNC_SECONDS: float = float(os.getenv("DIRECTORY_SYNC_SECONDS", "60"))
+    DIRECTORY_FULL_SYNC_SECONDS: float = float(os.getenv("DIRECTORY_FULL_SYNC_SECONDS", "3600"))
+
+    # Escritura por lotes de consultas (historia + examenes + procedimientos)
+    WRITE_BATCH_WINDOW_MS: float = float(os.getenv("WRITE_BATCH_WINDOW_MS", "10"))
+    WRITE_BATCH_MAX: int = int(os.getenv("WRITE_BATCH_MAX", "50"))
+
+    # Eventos en tiempo real (SSE)
+    EVENTS_QUEUE_SIZE: int = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+    EVENTS_KEEPALIVE_SECONDS: float = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+    # Arranque
+    IMPORT_TIME_BUDGET_MS: float = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+    # Marcas de los workers ya calientes (un archivo por worker, compartido en el pod)
+    READY_DIR: str = os.getenv("READY_DIR", "/tmp/hce_listos")
+    READY_HEARTBEAT_SECONDS: float = float(os.getenv("READY_HEARTBEAT_SECONDS", "5"))
+
+    # Snapshot analitico local (reportes)
+    SNAPSHOT_DB_PATH: str = os.getenv("SNAPSHOT_DB_PATH", "/tmp/hce_snapshot.db")
+    SNAPSHOT_INTERVAL_SECONDS: float = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))
+    SNAPSHOT_PAGE_SIZE: int = int(os.getenv("SNAPSHOT_PAGE_SIZE", "1000"))
+
 settings = Settings()
\ No newline at end of file
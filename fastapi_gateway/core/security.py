@@ -1,14 +1,18 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any, Union
 from jose import jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from core.config import settings
 
 # --- CORRECCIÓN AQUÍ ---
 # Cambiado a "bcrypt" para compatibilidad estándar y seguridad
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Se crea al primer uso: passlib y el backend bcrypt no se cargan al arrancar
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 security = HTTPBearer()
 
@@ -16,13 +20,13 @@ def hash_password(password: str) -> str:
     """
     Hashea la contraseña usando Bcrypt.
     """
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verifica la contraseña plana contra el hash guardado en la BD.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_token(subject: Union[str, Any], rol: str) -> str:
     expire = datetime.utcnow() + timedelta(hours=settings.JWT_EXPIRATION_HOURS)
@@ -1,15 +1,33 @@
+import time
+_inicio_import = time.perf_counter()
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import httpx
 import traceback
 
 from core.config import settings
+from services.search import indice_historias
+from services.pdf import shutdown_pool
+from services.directory import directorio
+from services.snapshot import snapshot
+from services.cache import cerrar_caches, estadisticas
+from services.events import bus_eventos
+from services.readiness import workers_listos
 # Importamos todos los routers.
 # Asegurate de que routers/internal.py, routers/auth.py, etc. existan.
-from routers import auth, pacientes, clinica, admin, internal
+# fpdf, numpy y passlib se cargan bajo demanda (ver services/pdf.py,
+# services/lab_analytics.py y core/security.py).
+from routers import auth, pacientes, clinica, admin, internal, reportes
+
+IMPORT_MS = (time.perf_counter() - _inicio_import) * 1000
+if IMPORT_MS > settings.IMPORT_TIME_BUDGET_MS:
+    print(f"⚠️ Importacion lenta: {IMPORT_MS:.0f} ms (presupuesto {settings.IMPORT_TIME_BUDGET_MS:.0f} ms)")
 
 app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION)
+app.state.listo = False
 
 # --- Middleware CORS ---
 app.add_middleware(
@@ -31,15 +49,61 @@ async def catch_exceptions_middleware(request: Request, call_next):
         return JSONResponse(status_code=500, content={"detail": "Error Interno", "error": str(e)})
 
 # --- Lifecycle (Cliente HTTP) ---
+async def calentar(client: httpx.AsyncClient):
+    """
+    Precalienta conexiones y caches en segundo plano.
+    /ready responde 503 hasta que termine, asi el pod no recibe trafico en frio.
+    """
+    async def ping(url: str):
+        try:
+            await client.get(url, timeout=5.0)
+        except Exception:
+            pass
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        # Abrir conexiones del pool HTTP hacia PostgREST y las otras sedes
+        ping(f"{settings.POSTGREST_URL}/"),
+        *[ping(url.rstrip("/") + "/health") for url in settings.SEDES_URLS],
+        # Cargamos el indice de busqueda de historias (si falla, se reintenta en la primera busqueda)
+        indice_historias.sincronizar(client, forzar=True),
+        # Directorio de doctores/admisionistas en memoria con sincronizacion incremental
+        directorio.iniciar(client),
+        return_exceptions=True,
+    )
+    for r in resultados:
+        if isinstance(r, Exception):
+            print(f"⚠️ Error precalentando: {r}")
+    app.state.calentamiento_ms = (time.perf_counter() - inicio) * 1000
+    app.state.listo = True
+    # Los demas workers del pod ven esta marca al responder /ready
+    workers_listos.marcar()
+    # Snapshot de reportes: arranca despues del calentamiento para no competir con el.
+    # Solo un worker por pod lo actualiza (lock sobre el archivo), el resto solo lee.
+    snapshot.iniciar(client)
+
 @app.on_event("startup")
 async def startup_event():
     # Creamos un cliente HTTP persistente para reutilizar conexiones
     app.state.http_client = httpx.AsyncClient(timeout=30.0)
+    # Eventos SSE: con Redis se reparten entre todos los workers del pod
+    bus_eventos.iniciar()
+    # El arranque no espera al calentamiento: uvicorn acepta conexiones de inmediato
+    app.state.tarea_calentar = asyncio.create_task(calentar(app.state.http_client))
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    tarea = getattr(app.state, "tarea_calentar", None)
+    if tarea and not tarea.done():
+        tarea.cancel()
+    directorio.detener()
+    snapshot.detener()
+    workers_listos.detener()
+    await bus_eventos.detener()
     if getattr(app.state, "http_client", None):
         await app.state.http_client.aclose()
+    shutdown_pool()
+    await cerrar_caches()
 
 # --- Registrar Routers ---
 # Es importante el orden. internal va primero o ultimo, no afecta mucho,
@@ -49,6 +113,7 @@ app.include_router(auth.router)     # Login y Auth
 app.include_router(pacientes.router) # CRUD Pacientes
 app.include_router(clinica.router)   # Historia Clínica y Exámenes
 app.include_router(admin.router)     # Doctores y Admisionistas
+app.include_router(reportes.router)  # Reportes sobre el snapshot local
 
 @app.get("/")
 def root():
@@ -63,5 +128,30 @@ async def health_check():
     return {
         "status": "ok", 
         "sedes_hermanas_configuradas": len(settings.SEDES_URLS),
-        "sedes_urls": settings.SEDES_URLS
+        "sedes_urls": settings.SEDES_URLS,
+        "caches": await estadisticas()
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness para Kubernetes: 200 solo cuando los pools HTTP, el indice
+    y el directorio estan calientes en todos los workers del pod (WEB_CONCURRENCY),
+    no solo en el que atiende el probe. El pool de PDF y passlib siguen siendo
+    perezosos: se cargan con el primer PDF o el primer login.
+    """
+    listos = workers_listos.contar() if app.state.listo else 0
+    if listos < settings.WEB_CONCURRENCY:
+        return JSONResponse(status_code=503, content={
+            "status": "calentando",
+            "import_ms": round(IMPORT_MS, 1),
+            "workers_listos": listos,
+            "workers": settings.WEB_CONCURRENCY,
+        })
+    return {
+        "status": "ready",
+        "import_ms": round(IMPORT_MS, 1),
+        "calentamiento_ms": round(app.state.calentamiento_ms, 1),
+        "workers_listos": listos,
+        "workers": settings.WEB_CONCURRENCY,
     }
\ No newline at end of file
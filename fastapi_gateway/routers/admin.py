@@ -6,6 +6,7 @@ import httpx
 from core.config import settings
 from core.security import hash_password, get_current_user
 from services.http_client import get_http_client
+from services.directory import directorio
 
 # Esquemas Pydantic
 from schemas import (
@@ -24,7 +25,9 @@ async def list_doctores(
     client: httpx.AsyncClient = Depends(get_http_client),
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtiene la lista de todos los doctores."""
+    """Obtiene la lista de todos los doctores (desde el directorio en memoria)."""
+    if directorio.listo:
+        return directorio.doctores.listar()
     response = await client.get(f"{settings.POSTGREST_URL}/doctores")
     if response.status_code == 200:
         return response.json()
@@ -37,6 +40,10 @@ async def get_doctor(
     current_user: dict = Depends(get_current_user)
 ):
     """Busca un doctor por ID."""
+    if directorio.listo:
+        doctor = directorio.doctores.obtener(id_doctor)
+        if doctor:
+            return doctor
     response = await client.get(
         f"{settings.POSTGREST_URL}/doctores",
         params={"id_doctor": f"eq.{id_doctor}"}
@@ -63,7 +70,9 @@ async def create_doctor(
     )
     
     if response.status_code == 201:
-        return response.json()[0]
+        creado = response.json()[0]
+        directorio.doctores.upsert(creado)
+        return creado
     elif response.status_code == 409:
         raise HTTPException(status_code=409, detail="El usuario o cédula ya existe")
     
@@ -78,7 +87,9 @@ async def list_admisionistas(
     client: httpx.AsyncClient = Depends(get_http_client),
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtiene la lista de admisionistas."""
+    """Obtiene la lista de admisionistas (desde el directorio en memoria)."""
+    if directorio.listo:
+        return directorio.admisionistas.listar()
     response = await client.get(f"{settings.POSTGREST_URL}/admisionistas")
     if response.status_code == 200:
         return response.json()
@@ -101,8 +112,34 @@ async def create_admisionista(
     )
     
     if response.status_code == 201:
-        return response.json()[0]
+        creado = response.json()[0]
+        directorio.admisionistas.upsert(creado)
+        return creado
     elif response.status_code == 409:
         raise HTTPException(status_code=409, detail="El usuario o cédula ya existe")
         
-    raise HTTPException(status_code=response.status_code, detail=f"Error creando admisionista: {response.text}")
\ No newline at end of file
+    raise HTTPException(status_code=response.status_code, detail=f"Error creando admisionista: {response.text}")
+
+# ==========================================
+# DIRECTORIO REPLICADO
+# ==========================================
+
+@router.post("/directorio/refrescar")
+async def refrescar_directorio(
+    client: httpx.AsyncClient = Depends(get_http_client),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Fuerza una recarga completa del directorio de doctores y admisionistas.
+    Los demas workers del pod la toman en su proximo ciclo (DIRECTORY_SYNC_SECONDS).
+    """
+    if current_user.get("rol") != "admisionista":
+        raise HTTPException(status_code=403, detail="Solo administradores pueden refrescar el directorio")
+    try:
+        await directorio.refrescar(client)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error refrescando directorio: {e}")
+    return {
+        "doctores": len(directorio.doctores.filas),
+        "admisionistas": len(directorio.admisionistas.filas),
+    }
\ No newline at end of file
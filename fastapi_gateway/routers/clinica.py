@@ -1,27 +1,69 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, List, Optional
+import asyncio
 import httpx
-import io
-from fpdf import FPDF
 from core.config import settings
-from schemas import HistoriaClinicaCreate
+from schemas import HistoriaClinicaCreate, ConsultaCreate, PdfLoteRequest
 from services.http_client import get_http_client
 from services.distributed import query_all_sedes 
+from services.search import indexar_historia, buscar_todas_sedes
+from services.pdf import generar_pdf, stream_zip
+from services.directory import directorio
+from services.write_pipeline import pipeline_escritura
+from services.events import bus_eventos, formato_sse
 
 router = APIRouter(prefix="/api/clinica", tags=["Clinica"])
 
-# --- GENERADOR DE PDF ---
-class PDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, 'Historia Clínica Electrónica', 0, 1, 'C')
-        self.ln(5)
+def _filtro_in(ids) -> str:
+    return f"in.({','.join(str(i) for i in ids)})"
 
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
+async def _datos_historias(ids_historia: List[int], client: httpx.AsyncClient) -> Dict[int, tuple]:
+    """
+    Busca de forma distribuida las historias, sus pacientes y sus doctores
+    con una consulta por tabla (filtro in.), sin importar cuantas historias sean.
+    Devuelve {id_historia: (historia, paciente, doctor)}; las que no existen no aparecen.
+    """
+    # 1. Buscar las Historias Clínicas (la primera sede que responde gana, como antes)
+    historias: Dict[int, dict] = {}
+    for h in await query_all_sedes("historia_clinica", {"id_historia_clinica": _filtro_in(ids_historia)}, client):
+        historias.setdefault(h.get("id_historia_clinica"), h)
+    if not historias:
+        return {}
+
+    # 2. Buscar datos de los Pacientes
+    ids_pacientes = {h.get("id_paciente") for h in historias.values()} - {None}
+    pacientes = {}
+    if ids_pacientes:
+        for p in await query_all_sedes("pacientes", {"id_paciente": _filtro_in(ids_pacientes)}, client):
+            pacientes.setdefault(p.get("id_paciente"), p)
+
+    # 3. Buscar datos de los Doctores: directorio en memoria, y a la BD solo los que falten
+    ids_doctores = {h.get("id_doctor") for h in historias.values()} - {None}
+    doctores = {i: directorio.doctores.obtener(i) for i in ids_doctores}
+    doctores = {i: d for i, d in doctores.items() if d}
+    faltantes = ids_doctores - doctores.keys()
+    if faltantes:
+        for d in await query_all_sedes("doctores", {"id_doctor": _filtro_in(faltantes)}, client):
+            doctores.setdefault(d.get("id_doctor"), d)
+
+    paciente_desconocido = {"nombres": "Desconocido", "apellidos": "", "cedula": "N/A"}
+    doctor_desconocido = {"nombres": "Dr.", "apellidos": "Desconocido", "especialidad": "General"}
+    return {
+        id_historia: (
+            historia,
+            pacientes.get(historia.get("id_paciente"), paciente_desconocido),
+            doctores.get(historia.get("id_doctor"), doctor_desconocido),
+        )
+        for id_historia, historia in historias.items()
+    }
+
+async def _datos_historia(id_historia: int, client: httpx.AsyncClient):
+    """
+    Busca de forma distribuida la historia, el paciente y el doctor.
+    Devuelve None si la historia no existe.
+    """
+    return (await _datos_historias([id_historia], client)).get(id_historia)
 
 @router.get("/pdf/{id_historia}")
 async def descargar_historia_pdf(
@@ -30,85 +72,187 @@ async def descargar_historia_pdf(
 ):
     """
     Genera y descarga un PDF con la historia clínica.
-    Busca datos de forma distribuida.
+    Busca datos de forma distribuida; el render corre en el pool de procesos
+    y se reutiliza si el contenido no ha cambiado.
     """
-    # 1. Buscar la Historia Clínica
-    historias = await query_all_sedes("historia_clinica", {"id_historia_clinica": f"eq.{id_historia}"}, client)
-    if not historias:
+    datos = await _datos_historia(id_historia, client)
+    if not datos:
         raise HTTPException(404, "Historia clínica no encontrada")
-    historia = historias[0]
-
-    # 2. Buscar datos del Paciente (Distribuido)
-    id_paciente = historia.get("id_paciente")
-    pacientes = await query_all_sedes("pacientes", {"id_paciente": f"eq.{id_paciente}"}, client)
-    paciente = pacientes[0] if pacientes else {"nombres": "Desconocido", "apellidos": "", "cedula": "N/A"}
-
-    # 3. Buscar datos del Doctor (Distribuido)
-    id_doctor = historia.get("id_doctor")
-    doctores = await query_all_sedes("doctores", {"id_doctor": f"eq.{id_doctor}"}, client)
-    doctor = doctores[0] if doctores else {"nombres": "Dr.", "apellidos": "Desconocido", "especialidad": "General"}
-
-    # 4. Construir el PDF
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-
-    # Datos del Paciente
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, "INFORMACIÓN DEL PACIENTE:", 0, 1)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, f"Nombre: {paciente['nombres']} {paciente['apellidos']}", 0, 1)
-    pdf.cell(0, 10, f"Cédula: {paciente['cedula']}", 0, 1)
-    pdf.ln(5)
-
-    # Datos de la Consulta
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, "DETALLES DE LA CONSULTA:", 0, 1)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, f"Fecha: {historia.get('fecha', 'N/A')}", 0, 1)
-    pdf.cell(0, 10, f"Médico Tratante: {doctor['nombres']} {doctor['apellidos']} ({doctor.get('especialidad', 'General')})", 0, 1)
-    pdf.cell(0, 10, f"Sede de Origen: {historia.get('sede_origen', 'Local').upper()}", 0, 1)
-    pdf.ln(5)
-
-    # Datos Clínicos (Bloque Multi-linea)
-    campos = [
-        ("Motivo de Consulta", historia.get("motivo")),
-        ("Síntomas", historia.get("sintomas_presentes")),
-        ("Signos Vitales", historia.get("signos_presenciales")),
-        ("Tratamiento", historia.get("tratamiento")),
-    ]
-
-    for titulo, contenido in campos:
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 8, f"{titulo}:", 0, 1)
-        pdf.set_font("Arial", size=11)
-        pdf.multi_cell(0, 6, str(contenido) if contenido else "No registrado")
-        pdf.ln(3)
-
-    # 5. Generar Stream de Bytes
-    # 'latin-1' es necesario para tildes básicas en fpdf
-    pdf_output = pdf.output(dest='S').encode('latin-1', 'ignore')
-    
-    return StreamingResponse(
-        io.BytesIO(pdf_output), 
+
+    pdf_output = await generar_pdf(*datos)
+
+    return Response(
+        content=pdf_output,
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename=historia_{id_historia}.pdf"}
     )
 
+@router.post("/pdf/lote")
+async def descargar_lote_pdf(
+    lote: PdfLoteRequest,
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    """
+    Exporta varias historias clínicas en un ZIP.
+    Los datos de todo el lote se traen antes de responder (una consulta por tabla);
+    cada PDF se agrega al stream en cuanto termina de renderizarse.
+    Una vez enviados los headers ningun error corta el ZIP: los ids que fallan
+    quedan listados en errores.txt y los inexistentes en no_encontradas.txt.
+    """
+    ids = list(dict.fromkeys(lote.ids_historia))
+    if len(ids) > settings.PDF_BATCH_MAX:
+        raise HTTPException(400, f"Maximo {settings.PDF_BATCH_MAX} historias por lote")
+
+    datos = await _datos_historias(ids, client) if ids else {}
+    limite = asyncio.Semaphore(settings.PDF_WORKERS * 2)
+
+    async def preparar(id_historia: int):
+        async with limite:
+            try:
+                return id_historia, await generar_pdf(*datos[id_historia]), None
+            except Exception as e:
+                return id_historia, None, e
+
+    async def archivos():
+        faltantes = [str(i) for i in ids if i not in datos]
+        errores = []
+        for tarea in asyncio.as_completed([preparar(i) for i in ids if i in datos]):
+            id_historia, data, error = await tarea
+            if error is not None:
+                print(f"Error generando PDF de historia {id_historia}: {error}")
+                errores.append(f"{id_historia}: {error}")
+                continue
+            yield f"historia_{id_historia}.pdf", data
+        if faltantes:
+            yield "no_encontradas.txt", ("\n".join(faltantes) + "\n").encode("utf-8")
+        if errores:
+            yield "errores.txt", ("\n".join(errores) + "\n").encode("utf-8")
+
+    return StreamingResponse(
+        stream_zip(archivos()),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=historias.zip"}
+    )
+
 # --- RUTAS EXISTENTES ---
 @router.get("/historia-clinica/{id_paciente}", response_model=List[dict])
 async def get_historia_clinica(id_paciente: int, client: httpx.AsyncClient = Depends(get_http_client)):
     return await query_all_sedes("historia_clinica", {"id_paciente": f"eq.{id_paciente}"}, client)
 
+@router.get("/busqueda", response_model=List[dict])
+async def buscar_historias(
+    q: str = Query(..., min_length=1, description="Texto a buscar en motivo, sintomas y tratamiento"),
+    k: int = Query(settings.SEARCH_TOP_K, ge=1, le=100),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    """
+    Busqueda de texto libre en historias clinicas de todas las sedes.
+    Cada sede responde con su top-k y aqui se mezclan en un top-k global.
+    """
+    return await buscar_todas_sedes(q, k, client)
+
 @router.post("/historia-clinica", response_model=dict)
-async def create_historia_clinica(historia: HistoriaClinicaCreate, client: httpx.AsyncClient = Depends(get_http_client)):
-    data = historia.dict()
-    resp = await client.post(f"{settings.POSTGREST_URL}/historia_clinica", json=data, headers={"Prefer": "return=representation"})
-    if resp.status_code == 201:
-        return resp.json()[0]
-    else:
-        raise HTTPException(status_code=resp.status_code, detail=f"Error: {resp.text}")
+async def create_historia_clinica(
+    historia: HistoriaClinicaCreate,
+    client: httpx.AsyncClient = Depends(get_http_client),
+    idempotency_key: Optional[str] = Header(None, max_length=100)
+):
+    consulta = ConsultaCreate(historia=historia)
+    creada = await _registrar_consulta(consulta, client, idempotency_key)
+    return creada["historia"]
+
+@router.post("/consultas", response_model=dict)
+async def create_consulta(
+    consulta: ConsultaCreate,
+    client: httpx.AsyncClient = Depends(get_http_client),
+    idempotency_key: Optional[str] = Header(None, max_length=100)
+):
+    """
+    Registra una historia con sus examenes y procedimientos como una sola unidad.
+    Con el header Idempotency-Key, los reintentos devuelven lo ya registrado.
+    """
+    return await _registrar_consulta(consulta, client, idempotency_key)
+
+async def _registrar_consulta(consulta: ConsultaCreate, client: httpx.AsyncClient, clave: Optional[str]) -> dict:
+    creada = await pipeline_escritura.registrar(consulta.dict(), client, clave)
+    if creada.get("repetida"):
+        # Reintento con Idempotency-Key: ya se indexo y se notifico la primera vez
+        return creada
+
+    # Mantener el indice de busqueda al dia sin esperar la siguiente sincronizacion
+    await indexar_historia(creada["historia"])
+
+    # Avisar a quienes observan al paciente (aqui y en las otras sedes)
+    id_paciente = creada["historia"].get("id_paciente")
+    await bus_eventos.publicar({"tipo": "historia_clinica", "id_paciente": id_paciente, "datos": creada["historia"]}, client)
+    if creada.get("examenes"):
+        await bus_eventos.publicar({"tipo": "examenes", "id_paciente": id_paciente, "datos": creada["examenes"]}, client)
+    return creada
+
+@router.get("/eventos")
+async def stream_eventos(
+    request: Request,
+    pacientes: str = Query(..., description="IDs de pacientes separados por coma, ej: 1,2,3")
+):
+    """
+    Server-Sent Events con las nuevas historias y examenes de los pacientes observados.
+    Reemplaza el polling a /historia-clinica/{id_paciente}.
+    """
+    try:
+        ids = {int(p) for p in pacientes.split(",") if p.strip()}
+    except ValueError:
+        raise HTTPException(400, "El parametro pacientes debe ser una lista de enteros")
+    if not ids:
+        raise HTTPException(400, "Debe indicar al menos un paciente")
+
+    cola = bus_eventos.suscribir(ids)
+
+    async def generador():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comentario SSE para mantener viva la conexion a traves de proxies
+                    yield ": ping\n\n"
+                    continue
+                yield formato_sse(evento)
+        finally:
+            bus_eventos.cancelar(cola, ids)
+
+    return StreamingResponse(
+        generador(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/examenes/{id_historia}", response_model=List[dict])
 async def get_examenes(id_historia: int, client: httpx.AsyncClient = Depends(get_http_client)):
-    return await query_all_sedes("examenes", {"id_historia_clinica": f"eq.{id_historia}"}, client)
\ No newline at end of file
+    return await query_all_sedes("examenes", {"id_historia_clinica": f"eq.{id_historia}"}, client)
+
+@router.get("/examenes/paciente/{id_paciente}/analitica", response_model=dict)
+async def get_analitica_examenes(
+    id_paciente: int,
+    ventana: int = Query(3, ge=1, le=50, description="Numero de resultados para la media movil"),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    """
+    Analitica de laboratorio de un paciente con los examenes de todas las sedes.
+    Los examenes se traen embebidos en sus historias (una consulta por sede)
+    y se procesan en columnas con NumPy.
+    """
+    historias = await query_all_sedes(
+        "historia_clinica",
+        {"id_paciente": f"eq.{id_paciente}", "select": "id_historia_clinica,examenes(*)"},
+        client
+    )
+    # NumPy se carga solo cuando alguien pide analitica
+    from services.lab_analytics import analizar_examenes
+
+    examenes = []
+    for h in historias:
+        for e in h.get("examenes") or []:
+            e["sede_origen"] = h.get("sede_origen")
+            examenes.append(e)
+    return analizar_examenes(examenes, ventana)
\ No newline at end of file
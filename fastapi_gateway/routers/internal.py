@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from typing import Optional
+import json
 import httpx
 from services.http_client import get_http_client
+from services.search import buscar_local, estadisticas_local, invalidar_busquedas
+from services.events import bus_eventos
 from core.config import settings
 
 # Prefijo para rutas internas que SOLO llaman los otros gateways
@@ -24,4 +28,49 @@ async def consulta_local_directa(
         response = await client.get(url, params=request.query_params)
         return response.json()
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+@router.get("/busqueda-estadisticas")
+async def busqueda_estadisticas(
+    q: str = Query(..., min_length=1),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    """
+    Endpoint de uso interno (fase 1 de la busqueda federada).
+    Devuelve N, largo total y frecuencia de documento de los terminos de la consulta.
+    """
+    return await estadisticas_local(q, client)
+
+@router.get("/busqueda-local")
+async def busqueda_local(
+    q: str = Query(..., min_length=1),
+    k: int = Query(settings.SEARCH_TOP_K, ge=1, le=100),
+    estadisticas: Optional[str] = Query(None, description="JSON con las estadisticas globales (fase 2)"),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    """
+    Endpoint de uso interno.
+    Devuelve el top-k local de historias clinicas para la consulta, sin fan-out.
+    Con `estadisticas` puntua con el IDF global para que los scores sean comparables.
+    """
+    globales = None
+    if estadisticas:
+        try:
+            globales = json.loads(estadisticas)
+        except ValueError:
+            raise HTTPException(400, "estadisticas debe ser JSON")
+    return await buscar_local(q, k, client, globales)
+
+@router.post("/eventos")
+async def recibir_evento(evento: dict, request: Request):
+    """
+    Endpoint de uso interno.
+    Recibe un evento escrito en otra sede y lo entrega a los suscriptores locales.
+    No se reenvia de nuevo (evita ciclos entre sedes).
+    """
+    evento["sede_origen"] = request.client.host if request.client else "remota"
+    await bus_eventos.publicar_local(evento)
+    if evento.get("tipo") == "historia_clinica":
+        # Una historia nueva en otra sede tambien deja viejas las busquedas cacheadas
+        await invalidar_busquedas()
+    return {"ok": True}
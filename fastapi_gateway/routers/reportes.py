@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+import httpx
+
+from core.security import get_current_user
+from services.http_client import get_http_client
+from services.snapshot import snapshot
+from services.directory import directorio
+
+# Reportes sobre el snapshot local (SQLite), nunca sobre PostgREST en vivo
+router = APIRouter(prefix="/api/reportes", tags=["Reportes"])
+
+def _filtros(columna_fecha: str, desde: Optional[str], hasta: Optional[str], sede: Optional[str], alias: str = ""):
+    """Arma el WHERE comun de fechas (YYYY-MM-DD) y sede."""
+    prefijo = f"{alias}." if alias else ""
+    condiciones, params = [], []
+    if desde:
+        condiciones.append(f"{prefijo}{columna_fecha} >= ?")
+        params.append(desde)
+    if hasta:
+        # fecha_registro es TIMESTAMP: incluimos todo el dia "hasta"
+        condiciones.append(f"substr({prefijo}{columna_fecha}, 1, 10) <= ?")
+        params.append(hasta)
+    if sede:
+        condiciones.append(f"{prefijo}sede = ?")
+        params.append(sede)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return where, tuple(params)
+
+@router.get("/visitas-por-doctor", response_model=List[dict])
+async def visitas_por_doctor(
+    desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    hasta: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    sede: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Cantidad de consultas y pacientes distintos por doctor y sede."""
+    where, params = _filtros("fecha", desde, hasta, sede)
+    filas = await snapshot.consultar(
+        f"""SELECT sede, id_doctor, COUNT(*) AS visitas, COUNT(DISTINCT id_paciente) AS pacientes
+            FROM historia_clinica {where}
+            GROUP BY sede, id_doctor ORDER BY visitas DESC""",
+        params
+    )
+    # Los nombres solo se conocen para los doctores de esta sede (directorio local)
+    for f in filas:
+        doctor = directorio.doctores.obtener(f["id_doctor"]) if f["sede"] == "local" else None
+        if doctor:
+            f["doctor"] = f"{doctor.get('nombres', '')} {doctor.get('apellidos', '')}".strip()
+    return filas
+
+@router.get("/diagnosticos-por-mes", response_model=List[dict])
+async def diagnosticos_por_mes(
+    desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    hasta: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    sede: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Casos por diagnostico (enfermedades) y mes de la consulta."""
+    where, params = _filtros("fecha", desde, hasta, sede, alias="h")
+    return await snapshot.consultar(
+        f"""SELECT substr(h.fecha, 1, 7) AS mes, e.codigo, e.enfermedad, COUNT(*) AS casos
+            FROM enfermedades e
+            JOIN historia_clinica h ON h.sede = e.sede AND h.id_historia_clinica = e.id_historia_clinica
+            {where}
+            GROUP BY mes, e.codigo, e.enfermedad ORDER BY mes, casos DESC""",
+        params
+    )
+
+@router.get("/examenes-por-sede", response_model=List[dict])
+async def examenes_por_sede(
+    desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    hasta: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    sede: Optional[str] = None,
+    por_examen: bool = Query(False, description="Desglosar por nombre de examen"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Volumen de examenes por sede y mes."""
+    where, params = _filtros("fecha_registro", desde, hasta, sede)
+    columnas = "sede, substr(fecha_registro, 1, 7) AS mes" + (", nombre_examen" if por_examen else "")
+    grupo = "sede, mes" + (", nombre_examen" if por_examen else "")
+    return await snapshot.consultar(
+        f"""SELECT {columnas}, COUNT(*) AS total
+            FROM examenes {where}
+            GROUP BY {grupo} ORDER BY {grupo}""",
+        params
+    )
+
+@router.get("/snapshot")
+async def estado_snapshot(current_user: dict = Depends(get_current_user)):
+    """Marcas de agua por sede/tabla y hora de la ultima actualizacion."""
+    return {
+        "ultima_actualizacion": await snapshot.leer_ultima_actualizacion(),
+        "actualizador": snapshot.actualizador,
+        "marcas": await snapshot.consultar("SELECT sede, tabla, max_id FROM marcas ORDER BY sede, tabla"),
+    }
+
+@router.post("/snapshot/actualizar")
+async def actualizar_snapshot(
+    client: httpx.AsyncClient = Depends(get_http_client),
+    current_user: dict = Depends(get_current_user)
+):
+    """Fuerza una actualizacion incremental del snapshot."""
+    if current_user.get("rol") != "admisionista":
+        raise HTTPException(status_code=403, detail="Solo administradores pueden actualizar el snapshot")
+    return {"filas_nuevas": await snapshot.actualizar(client)}
@@ -76,6 +76,29 @@ class HistoriaClinicaResponse(HistoriaClinicaCreate):
     id_historia_clinica: int
     sede_origen: Optional[str] = "local"
 
+class ExamenCreate(BaseModel):
+    nombre_examen: str
+    descripcion: Optional[str] = None
+    valor_bajo: Optional[float] = None
+    valor_alto: Optional[float] = None
+    resultado: Optional[float] = None
+    valor: Optional[str] = None
+    fecha_registro: Optional[str] = None # ISO, por defecto NOW()
+
+class ProcedimientoCreate(BaseModel):
+    nombre_procedimiento: str
+    resultado: Optional[str] = None
+    valor: Optional[str] = None
+    fecha_registro: Optional[str] = None
+
+class ConsultaCreate(BaseModel):
+    historia: HistoriaClinicaCreate
+    examenes: List[ExamenCreate] = []
+    procedimientos: List[ProcedimientoCreate] = []
+
+class PdfLoteRequest(BaseModel):
+    ids_historia: List[int]
+
 # =======================
 # 4. DOCTORES (RESTAURADO)
 # =======================
@@ -0,0 +1,182 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+from core.config import settings
+
+
+class CacheBackend(ABC):
+    """
+    Interfaz comun de las caches del gateway. Los valores son bytes;
+    get_json/set_json serializan para los llamadores que guardan dicts/listas.
+    Un error del backend nunca rompe la peticion: se trata como un miss.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.hits = 0
+        self.misses = 0
+        self.errores = 0
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    async def close(self):
+        pass
+
+    async def get_json(self, key: str) -> Any:
+        data = await self.get(key)
+        return json.loads(data) if data is not None else None
+
+    async def set_json(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.set(key, json.dumps(value, default=str).encode("utf-8"), ttl)
+
+    def _contar(self, valor) -> Any:
+        if valor is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return valor
+
+    async def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errores": self.errores,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+class MemoriaLRU(CacheBackend):
+    """
+    Cache LRU dentro del proceso. Es la opcion por defecto (un solo worker).
+    """
+
+    def __init__(self, nombre: str, max_items: int):
+        super().__init__(nombre)
+        self.max_items = max_items
+        self._datos: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._datos.get(key)
+        if item is not None and item[1] is not None and item[1] < time.monotonic():
+            await self.delete(key)
+            item = None
+        if item is not None:
+            self._datos.move_to_end(key)
+        return self._contar(item[0] if item else None)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await self.delete(key)
+        self._datos[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._bytes += len(value)
+        while len(self._datos) > self.max_items:
+            _, (viejo, _) = self._datos.popitem(last=False)
+            self._bytes -= len(viejo)
+
+    async def delete(self, key: str):
+        item = self._datos.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[0])
+
+    async def stats(self) -> dict:
+        return {**await super().stats(), "items": len(self._datos), "bytes": self._bytes}
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache compartida entre todos los workers del pod (Redis o compatible,
+    p. ej. un sidecar en localhost). Requiere el paquete `redis`.
+    """
+
+    def __init__(self, nombre: str, url: str):
+        super().__init__(nombre)
+        # Import diferido: solo se necesita si CACHE_BACKEND=redis
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._prefijo = f"hce:{nombre}:"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._contar(await self._redis.get(self._prefijo + key))
+        except Exception as e:
+            self.errores += 1
+            print(f"Error cache {self.nombre}: {e}")
+            return self._contar(None)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        try:
+            await self._redis.set(self._prefijo + key, value, px=int(ttl * 1000) if ttl else None)
+        except Exception as e:
+            self.errores += 1
+            print(f"Error cache {self.nombre}: {e}")
+
+    async def delete(self, key: str):
+        try:
+            await self._redis.delete(self._prefijo + key)
+        except Exception as e:
+            self.errores += 1
+            print(f"Error cache {self.nombre}: {e}")
+
+    async def stats(self) -> dict:
+        datos = await super().stats()
+        try:
+            # Memoria del servidor Redis (compartida por todas las caches y workers del pod)
+            info = await self._redis.info("memory")
+            datos.update({
+                "bytes": info.get("used_memory"),
+                "maxmemory": info.get("maxmemory"),
+                "politica": info.get("maxmemory_policy"),
+            })
+        except Exception as e:
+            datos["error_info"] = str(e)
+        return datos
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+_caches: Dict[str, CacheBackend] = {}
+# Caches internas (p. ej. versiones/marcas) que no se muestran en /health
+_no_reportadas: Set[str] = set()
+
+
+def crear_cache(nombre: str, max_items: int, reportar: bool = True) -> CacheBackend:
+    """
+    Devuelve la cache `nombre` con el backend elegido en settings.CACHE_BACKEND
+    ("memoria" o "redis"). max_items solo aplica al LRU en memoria; en Redis
+    el limite lo pone maxmemory/maxmemory-policy del servidor.
+    Con reportar=False la cache no aparece en estadisticas().
+    """
+    if nombre not in _caches:
+        if settings.CACHE_BACKEND == "redis":
+            _caches[nombre] = RedisCache(nombre, settings.REDIS_URL)
+        elif settings.CACHE_BACKEND == "memoria":
+            _caches[nombre] = MemoriaLRU(nombre, max_items)
+        else:
+            raise ValueError(f"CACHE_BACKEND desconocido: {settings.CACHE_BACKEND}")
+        if not reportar:
+            _no_reportadas.add(nombre)
+    return _caches[nombre]
+
+
+async def estadisticas() -> Dict[str, dict]:
+    return {nombre: await cache.stats() for nombre, cache in _caches.items() if nombre not in _no_reportadas}
+
+
+async def cerrar_caches():
+    for cache in _caches.values():
+        await cache.close()
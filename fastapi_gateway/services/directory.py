@@ -0,0 +1,189 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+from core.config import settings
+from services.cache import crear_cache
+
+# Nunca guardamos hashes de contrasena en memoria
+COLUMNAS_EXCLUIDAS = {"contrasena"}
+
+
+class TablaReplicada:
+    """
+    Copia en memoria de una tabla pequena (doctores, admisionistas).
+    Las filas se guardan como tuplas (columnas compartidas) y se indexan
+    por id y por usuario.
+    """
+
+    def __init__(self, tabla: str, pk: str):
+        self.tabla = tabla
+        self.pk = pk
+        self.columnas: Tuple[str, ...] = ()
+        self.filas: List[tuple] = []
+        self.por_id: Dict[int, int] = {}
+        self.por_usuario: Dict[str, int] = {}
+        self.max_id = 0
+        self.ultima_carga_completa = 0.0
+
+    def _a_dict(self, fila: tuple) -> dict:
+        return dict(zip(self.columnas, fila))
+
+    def reemplazar(self, registros: List[dict], edad: float = 0.0):
+        """
+        Reemplaza todas las filas. `edad` son los segundos que ya tiene la carga
+        (p. ej. si viene de la cache compartida) para no darla por recien hecha.
+        """
+        columnas = tuple(c for c in (registros[0] if registros else {}) if c not in COLUMNAS_EXCLUIDAS)
+        filas, por_id, por_usuario = [], {}, {}
+        for r in registros:
+            pos = len(filas)
+            filas.append(tuple(r.get(c) for c in columnas))
+            por_id[r[self.pk]] = pos
+            if r.get("usuario"):
+                por_usuario[r["usuario"]] = pos
+        # Se asigna todo junto para que los lectores nunca vean un estado a medias
+        self.columnas, self.filas, self.por_id, self.por_usuario = columnas, filas, por_id, por_usuario
+        self.max_id = max(por_id, default=0)
+        self.ultima_carga_completa = time.monotonic() - edad
+
+    def upsert(self, registro: dict):
+        if not self.columnas:
+            self.reemplazar([registro])
+            return
+        fila = tuple(registro.get(c) for c in self.columnas)
+        pos = self.por_id.get(registro[self.pk])
+        if pos is None:
+            pos = len(self.filas)
+            self.filas.append(fila)
+            self.por_id[registro[self.pk]] = pos
+        else:
+            anterior = self.filas[pos]
+            self.filas[pos] = fila
+            usuario_anterior = anterior[self.columnas.index("usuario")] if "usuario" in self.columnas else None
+            if usuario_anterior and usuario_anterior != registro.get("usuario"):
+                self.por_usuario.pop(usuario_anterior, None)
+        if registro.get("usuario"):
+            self.por_usuario[registro["usuario"]] = pos
+        self.max_id = max(self.max_id, registro[self.pk])
+
+    def listar(self) -> List[dict]:
+        return [self._a_dict(f) for f in self.filas]
+
+    def obtener(self, id_registro: int) -> Optional[dict]:
+        pos = self.por_id.get(id_registro)
+        return self._a_dict(self.filas[pos]) if pos is not None else None
+
+    def obtener_por_usuario(self, usuario: str) -> Optional[dict]:
+        pos = self.por_usuario.get(usuario)
+        return self._a_dict(self.filas[pos]) if pos is not None else None
+
+
+class Directorio:
+    """
+    Directorio replicado de doctores y admisionistas.
+    - Carga completa al arrancar y cada DIRECTORY_FULL_SYNC_SECONDS (detecta cambios y borrados).
+    - Entre cargas completas, sincroniza incrementalmente por id (> ultimo id visto).
+    - Un refresco forzado (refrescar) cambia la version compartida; los demas workers
+      la ven en su proximo ciclo y recargan desde la copia compartida.
+    """
+
+    def __init__(self):
+        self.doctores = TablaReplicada("doctores", "id_doctor")
+        self.admisionistas = TablaReplicada("admisionistas", "id_admisionista")
+        self.listo = False
+        self._tarea: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        # Copia de la ultima carga completa: otro worker que arranca la reutiliza
+        self._cache = crear_cache("directorio", len(self.tablas))
+        self._versiones = crear_cache("versiones", 16, reportar=False)
+        self._version: Optional[bytes] = None
+
+    @property
+    def tablas(self) -> List[TablaReplicada]:
+        return [self.doctores, self.admisionistas]
+
+    async def _cargar_tabla(self, tabla: TablaReplicada, client: httpx.AsyncClient, completa: bool):
+        params = {"order": f"{tabla.pk}.asc"}
+        if not completa:
+            params[tabla.pk] = f"gt.{tabla.max_id}"
+        resp = await client.get(f"{settings.POSTGREST_URL}/{tabla.tabla}", params=params)
+        resp.raise_for_status()
+        registros = resp.json()
+        if completa:
+            tabla.reemplazar(registros)
+            await self._cache.set_json(
+                tabla.tabla,
+                {"cargado_en": time.time(), "registros": tabla.listar()},
+                ttl=settings.DIRECTORY_FULL_SYNC_SECONDS,
+            )
+        else:
+            for r in registros:
+                tabla.upsert(r)
+
+    async def sincronizar(self, client: httpx.AsyncClient, forzar: bool = False):
+        async with self._lock:
+            ahora = time.monotonic()
+            for tabla in self.tablas:
+                completa = forzar or not self.listo or (
+                    ahora - tabla.ultima_carga_completa >= settings.DIRECTORY_FULL_SYNC_SECONDS
+                )
+                await self._cargar_tabla(tabla, client, completa)
+            self.listo = True
+
+    async def refrescar(self, client: httpx.AsyncClient):
+        """Recarga completa en este worker y aviso a los demas workers del pod."""
+        await self.sincronizar(client, forzar=True)
+        self._version = str(time.time_ns()).encode()
+        await self._versiones.set("directorio", self._version)
+
+    async def _bucle(self, client: httpx.AsyncClient):
+        while True:
+            await asyncio.sleep(settings.DIRECTORY_SYNC_SECONDS)
+            try:
+                version = await self._versiones.get("directorio")
+                if version is not None and version != self._version:
+                    # Otro worker hizo un refresco forzado: tomamos su copia
+                    self._version = version
+                    if await self._desde_cache():
+                        await self.sincronizar(client)
+                    else:
+                        await self.sincronizar(client, forzar=True)
+                else:
+                    await self.sincronizar(client)
+            except Exception as e:
+                print(f"Error sincronizando directorio: {e}")
+
+    async def _desde_cache(self) -> bool:
+        """
+        Carga el directorio desde la cache compartida si otro worker ya lo bajo.
+        Luego basta una sincronizacion incremental.
+        """
+        for tabla in self.tablas:
+            copia = await self._cache.get_json(tabla.tabla)
+            if not isinstance(copia, dict):
+                return False
+            # Se conserva la antiguedad real: la proxima carga completa llega a tiempo
+            tabla.reemplazar(copia["registros"], edad=max(time.time() - copia["cargado_en"], 0.0))
+        self.listo = True
+        return True
+
+    async def iniciar(self, client: httpx.AsyncClient):
+        try:
+            self._version = await self._versiones.get("directorio")
+            if await self._desde_cache():
+                await self.sincronizar(client)
+            else:
+                await self.sincronizar(client, forzar=True)
+        except Exception as e:
+            # Si PostgREST no esta listo, el bucle lo reintenta; mientras tanto se lee de la BD
+            print(f"Error cargando directorio: {e}")
+        self._tarea = asyncio.create_task(self._bucle(client))
+
+    def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+
+
+directorio = Directorio()
@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+import httpx
+from core.config import settings
+
+# Canal de Redis por el que se reparten los eventos entre los workers del pod
+CANAL_EVENTOS = "hce:eventos"
+
+
+class BusEventos:
+    """
+    Publica eventos de nuevos registros clinicos (historia_clinica, examenes)
+    a los suscriptores SSE que observan al paciente. Los eventos escritos en
+    esta sede se reenvian a las demas sedes por /internal/api/eventos.
+
+    Los suscriptores viven en cada proceso. Con CACHE_BACKEND=redis cada evento
+    se publica en Redis (pub/sub) y todos los workers del pod lo entregan a sus
+    suscriptores; con "memoria" solo se soporta un worker por pod.
+    """
+
+    def __init__(self):
+        self._suscriptores: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._secuencia = itertools.count(1)
+        self._tareas: Set[asyncio.Task] = set()
+        self._redis = None
+        self._escucha: Optional[asyncio.Task] = None
+
+    def iniciar(self):
+        if settings.CACHE_BACKEND != "redis":
+            if settings.WEB_CONCURRENCY > 1:
+                print("⚠️ /api/clinica/eventos requiere CACHE_BACKEND=redis con varios workers: "
+                      "los eventos escritos en un worker no llegan a los clientes de otro.")
+            return
+        # Import diferido: solo se necesita si CACHE_BACKEND=redis
+        import redis.asyncio as redis
+        self._redis = redis.from_url(settings.REDIS_URL)
+        self._escucha = asyncio.create_task(self._escuchar())
+
+    async def detener(self):
+        if self._escucha:
+            self._escucha.cancel()
+            self._escucha = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _escuchar(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(CANAL_EVENTOS)
+                try:
+                    async for mensaje in pubsub.listen():
+                        if mensaje.get("type") == "message":
+                            self._entregar(json.loads(mensaje["data"]))
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error escuchando eventos en Redis: {e}")
+                await asyncio.sleep(1)
+
+    def suscribir(self, pacientes: Iterable[int]) -> asyncio.Queue:
+        cola: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        for id_paciente in pacientes:
+            self._suscriptores[id_paciente].add(cola)
+        return cola
+
+    def cancelar(self, cola: asyncio.Queue, pacientes: Iterable[int]):
+        for id_paciente in pacientes:
+            colas = self._suscriptores.get(id_paciente)
+            if colas is None:
+                continue
+            colas.discard(cola)
+            if not colas:
+                del self._suscriptores[id_paciente]
+
+    async def publicar_local(self, evento: dict):
+        """
+        Entrega el evento a los suscriptores de esta sede (todos los workers del pod).
+        Si Redis falla, al menos llega a los de este worker.
+        """
+        if self._redis is not None:
+            try:
+                evento["id"] = await self._redis.incr(CANAL_EVENTOS + ":secuencia")
+                await self._redis.publish(CANAL_EVENTOS, json.dumps(evento, default=str))
+                return
+            except Exception as e:
+                print(f"Error publicando evento en Redis: {e}")
+        evento["id"] = next(self._secuencia)
+        self._entregar(evento)
+
+    def _entregar(self, evento: dict):
+        for cola in self._suscriptores.get(evento.get("id_paciente"), ()):
+            if cola.full():
+                # Cliente lento: descartamos el evento mas viejo en vez de bloquear al escritor
+                cola.get_nowait()
+            cola.put_nowait(evento)
+
+    async def publicar(self, evento: dict, client: httpx.AsyncClient):
+        """
+        Entrega el evento a los suscriptores locales y lo reenvia a las otras sedes
+        en segundo plano (sin hacer esperar a la peticion que escribio).
+        """
+        await self.publicar_local({**evento, "sede_origen": "local"})
+        if settings.SEDES_URLS:
+            tarea = asyncio.create_task(self._reenviar(evento, client))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    async def _reenviar(self, evento: dict, client: httpx.AsyncClient):
+        async def enviar(sede_url: str):
+            try:
+                url = sede_url.rstrip("/") + "/internal/api/eventos"
+                await client.post(url, json=evento, timeout=5.0)
+            except Exception as e:
+                print(f"Error reenviando evento a {sede_url}: {e}")
+
+        await asyncio.gather(*[enviar(url) for url in settings.SEDES_URLS])
+
+
+bus_eventos = BusEventos()
+
+
+def formato_sse(evento: dict) -> str:
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
@@ -0,0 +1,126 @@
+import numpy as np
+from typing import List
+
+# Segundos en un dia, para expresar tendencias en "unidades por dia"
+_SEG_DIA = 86400.0
+
+
+def _fecha(valor) -> str:
+    # PostgREST devuelve TIMESTAMP como ISO; recortamos a segundos (ignora micro y zona)
+    return str(valor)[:19] if valor else "NaT"
+
+
+def _media_por_grupo(sumas, conteos):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(conteos > 0, sumas / np.maximum(conteos, 1), np.nan)
+
+
+def analizar_examenes(examenes: List[dict], ventana: int = 3) -> dict:
+    """
+    Calcula en una sola pasada vectorizada (NumPy) sobre todos los examenes:
+    - Marca fuera de rango (resultado < valor_bajo o > valor_alto).
+    - Media movil de los ultimos `ventana` resultados del mismo examen.
+    - Z-score de cada resultado respecto a su tipo de examen.
+    - Resumen por examen: n, media, desviacion, min, max, ultimo y tendencia (pendiente por dia).
+    """
+    if not examenes:
+        return {"resumen": [], "examenes": []}
+
+    # 1. Pasar filas a columnas
+    nombres = np.array([str(e.get("nombre_examen") or "") for e in examenes], dtype=object)
+    resultado = np.array([e.get("resultado") for e in examenes], dtype=float)
+    bajo = np.array([e.get("valor_bajo") for e in examenes], dtype=float)
+    alto = np.array([e.get("valor_alto") for e in examenes], dtype=float)
+    fechas = np.array([_fecha(e.get("fecha_registro")) for e in examenes], dtype="datetime64[s]")
+
+    # 2. Ordenar por (examen, fecha) -> cada tipo de examen queda contiguo y cronologico
+    tipos, codigo = np.unique(nombres, return_inverse=True)
+    orden = np.lexsort((fechas, codigo))
+    codigo, resultado, bajo, alto, fechas = (a[orden] for a in (codigo, resultado, bajo, alto, fechas))
+
+    n = len(orden)
+    valido = ~np.isnan(resultado)
+    valores = np.where(valido, resultado, 0.0)
+
+    # 3. Fuera de rango
+    with np.errstate(invalid="ignore"):
+        es_bajo = valido & ~np.isnan(bajo) & (resultado < bajo)
+        es_alto = valido & ~np.isnan(alto) & (resultado > alto)
+    estado = np.where(es_bajo, "bajo", np.where(es_alto, "alto", np.where(valido, "normal", "sin_dato")))
+
+    # 4. Estadisticas por grupo con bincount
+    k = len(tipos)
+    cnt = np.bincount(codigo, weights=valido, minlength=k)
+    suma = np.bincount(codigo, weights=valores, minlength=k)
+    suma2 = np.bincount(codigo, weights=valores * valores, minlength=k)
+    media = _media_por_grupo(suma, cnt)
+    with np.errstate(invalid="ignore"):
+        desv = np.sqrt(np.maximum(_media_por_grupo(suma2, cnt) - media * media, 0.0))
+    minimo = np.full(k, np.inf)
+    maximo = np.full(k, -np.inf)
+    np.minimum.at(minimo, codigo[valido], resultado[valido])
+    np.maximum.at(maximo, codigo[valido], resultado[valido])
+
+    # 5. Z-score por fila
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(valido & (desv[codigo] > 0), (resultado - media[codigo]) / desv[codigo], np.nan)
+
+    # 6. Media movil dentro de cada grupo usando sumas acumuladas
+    inicio_grupo = np.searchsorted(codigo, np.arange(k))
+    idx = np.arange(n)
+    desde = np.maximum(idx - ventana + 1, inicio_grupo[codigo])
+    acum = np.concatenate(([0.0], np.cumsum(valores)))
+    acum_cnt = np.concatenate(([0.0], np.cumsum(valido)))
+    media_movil = _media_por_grupo(acum[idx + 1] - acum[desde], acum_cnt[idx + 1] - acum_cnt[desde])
+
+    # 7. Tendencia: pendiente de minimos cuadrados resultado ~ dias, por grupo
+    con_fecha = valido & ~np.isnat(fechas)
+    t0 = fechas[con_fecha].min() if con_fecha.any() else np.datetime64(0, "s")
+    dias = np.where(con_fecha, (fechas - t0).astype("float64") / _SEG_DIA, 0.0)
+    y = np.where(con_fecha, resultado, 0.0)
+    pn = np.bincount(codigo, weights=con_fecha, minlength=k)
+    sx = np.bincount(codigo, weights=dias, minlength=k)
+    sy = np.bincount(codigo, weights=y, minlength=k)
+    sxx = np.bincount(codigo, weights=dias * dias, minlength=k)
+    sxy = np.bincount(codigo, weights=dias * y, minlength=k)
+    denom = pn * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pendiente = np.where((pn >= 2) & (denom > 0), (pn * sxy - sx * sy) / denom, np.nan)
+
+    # Ultimo resultado valido y con fecha de cada grupo (las filas ya estan en orden
+    # cronologico, pero las sin fecha quedan al final). Si ninguno tiene fecha, el ultimo valido.
+    ultimo_idx = np.full(k, -1)
+    np.maximum.at(ultimo_idx, codigo, np.where(con_fecha, idx, -1))
+    ultimo_sin_fecha = np.full(k, -1)
+    np.maximum.at(ultimo_sin_fecha, codigo, np.where(valido, idx, -1))
+    ultimo_idx = np.where(ultimo_idx >= 0, ultimo_idx, ultimo_sin_fecha)
+
+    fuera = np.bincount(codigo, weights=es_bajo | es_alto, minlength=k)
+
+    def _num(v):
+        return None if np.isnan(v) or np.isinf(v) else round(float(v), 4)
+
+    resumen = [
+        {
+            "nombre_examen": tipos[g],
+            "n": int(cnt[g]),
+            "media": _num(media[g]),
+            "desviacion": _num(desv[g]),
+            "minimo": _num(minimo[g]),
+            "maximo": _num(maximo[g]),
+            "ultimo": _num(resultado[ultimo_idx[g]]) if ultimo_idx[g] >= 0 else None,
+            "tendencia_por_dia": _num(pendiente[g]),
+            "fuera_de_rango": int(fuera[g]),
+        }
+        for g in range(k)
+    ]
+
+    filas = []
+    for pos, original in enumerate(orden):
+        fila = dict(examenes[original])
+        fila["estado"] = str(estado[pos])
+        fila["z_score"] = _num(z[pos])
+        fila["media_movil"] = _num(media_movil[pos])
+        filas.append(fila)
+
+    return {"resumen": resumen, "examenes": filas}
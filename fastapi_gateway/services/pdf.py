@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional
+from core.config import settings
+from services.cache import crear_cache
+
+# --- GENERADOR DE PDF ---
+@lru_cache(maxsize=None)
+def _clase_pdf():
+    # fpdf solo se importa en los procesos del pool, nunca en el worker de uvicorn
+    from fpdf import FPDF
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_font('Arial', 'B', 15)
+            self.cell(0, 10, 'Historia Clínica Electrónica', 0, 1, 'C')
+            self.ln(5)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font('Arial', 'I', 8)
+            self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
+
+    return PDF
+
+
+def render_historia_pdf(historia: dict, paciente: dict, doctor: dict) -> bytes:
+    """
+    Construye el PDF de una historia clinica y devuelve los bytes.
+    Es una funcion pura a nivel de modulo para poder ejecutarla en el pool de procesos.
+    """
+    pdf = _clase_pdf()()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Datos del Paciente
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "INFORMACIÓN DEL PACIENTE:", 0, 1)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 10, f"Nombre: {paciente['nombres']} {paciente['apellidos']}", 0, 1)
+    pdf.cell(0, 10, f"Cédula: {paciente['cedula']}", 0, 1)
+    pdf.ln(5)
+
+    # Datos de la Consulta
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "DETALLES DE LA CONSULTA:", 0, 1)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 10, f"Fecha: {historia.get('fecha', 'N/A')}", 0, 1)
+    pdf.cell(0, 10, f"Médico Tratante: {doctor['nombres']} {doctor['apellidos']} ({doctor.get('especialidad', 'General')})", 0, 1)
+    pdf.cell(0, 10, f"Sede de Origen: {historia.get('sede_origen', 'Local').upper()}", 0, 1)
+    pdf.ln(5)
+
+    # Datos Clínicos (Bloque Multi-linea)
+    campos = [
+        ("Motivo de Consulta", historia.get("motivo")),
+        ("Síntomas", historia.get("sintomas_presentes")),
+        ("Signos Vitales", historia.get("signos_presenciales")),
+        ("Tratamiento", historia.get("tratamiento")),
+    ]
+
+    for titulo, contenido in campos:
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 8, f"{titulo}:", 0, 1)
+        pdf.set_font("Arial", size=11)
+        pdf.multi_cell(0, 6, str(contenido) if contenido else "No registrado")
+        pdf.ln(3)
+
+    # 'latin-1' es necesario para tildes básicas en fpdf
+    return pdf.output(dest='S').encode('latin-1', 'ignore')
+
+
+# --- POOL DE PROCESOS + CACHE POR CONTENIDO ---
+_pool: Optional[ProcessPoolExecutor] = None
+_cache = crear_cache("pdf", settings.PDF_CACHE_MAX_ITEMS)
+_en_curso: Dict[str, asyncio.Future] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Se crea con el primer render: los workers que nunca generan PDF no pagan su memoria
+    global _pool
+    if _pool is None:
+        # 'spawn' evita heredar los hilos/sockets del proceso de uvicorn
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def pdf_cache_key(historia: dict, paciente: dict, doctor: dict) -> str:
+    """
+    Hash del contenido que aparece en el PDF: si no cambia, el PDF tampoco.
+    """
+    contenido = json.dumps([historia, paciente, doctor], sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+async def generar_pdf(historia: dict, paciente: dict, doctor: dict) -> bytes:
+    """
+    Devuelve el PDF desde cache o lo renderiza en el pool de procesos,
+    sin bloquear el event loop. Peticiones simultaneas del mismo contenido
+    comparten un unico render.
+    """
+    key = pdf_cache_key(historia, paciente, doctor)
+    data = await _cache.get(key)
+    if data is not None:
+        return data
+
+    if key in _en_curso:
+        return await asyncio.shield(_en_curso[key])
+
+    loop = asyncio.get_running_loop()
+    futuro = loop.run_in_executor(_get_pool(), render_historia_pdf, historia, paciente, doctor)
+    _en_curso[key] = futuro
+    try:
+        data = await asyncio.shield(futuro)
+    finally:
+        _en_curso.pop(key, None)
+
+    await _cache.set(key, data)
+    return data
+
+
+class _ZipBuffer:
+    """
+    Archivo de solo escritura para zipfile: acumula lo escrito hasta que
+    el generador lo entrega al cliente (zipfile maneja el caso no-seekable).
+    """
+    def __init__(self):
+        self._partes = []
+
+    def write(self, data: bytes) -> int:
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drenar(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes = []
+        return data
+
+
+async def stream_zip(archivos):
+    """
+    Recibe un iterador asincrono de (nombre, bytes) y va emitiendo el ZIP
+    a medida que llega cada archivo.
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        async for nombre, data in archivos:
+            zf.writestr(nombre, data)
+            yield buffer.drenar()
+    yield buffer.drenar()
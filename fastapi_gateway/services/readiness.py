@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from core.config import settings
+
+
+class WorkersListos:
+    """
+    Marcas de los workers de uvicorn del pod que ya terminaron el calentamiento:
+    un archivo por worker en un directorio compartido. El probe /ready llega a un
+    worker cualquiera, asi que solo responde 200 cuando hay WEB_CONCURRENCY marcas.
+    Cada worker renueva la suya mientras vive; la de un worker caido caduca sola.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self._tarea: Optional[asyncio.Task] = None
+
+    @property
+    def _ruta(self) -> str:
+        return os.path.join(self.directorio, f"{os.getpid()}.listo")
+
+    @property
+    def _caducidad(self) -> float:
+        return settings.READY_HEARTBEAT_SECONDS * 3
+
+    def _tocar(self):
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(self._ruta, "a"):
+            pass
+        os.utime(self._ruta)
+
+    def marcar(self):
+        self._tocar()
+        self._tarea = asyncio.create_task(self._latido())
+
+    async def _latido(self):
+        while True:
+            await asyncio.sleep(settings.READY_HEARTBEAT_SECONDS)
+            try:
+                self._tocar()
+            except OSError as e:
+                print(f"Error renovando marca de listo: {e}")
+
+    def contar(self) -> int:
+        """Workers del pod con la marca vigente."""
+        limite = time.time() - self._caducidad
+        try:
+            entradas = list(os.scandir(self.directorio))
+        except FileNotFoundError:
+            return 0
+        vigentes = 0
+        for entrada in entradas:
+            try:
+                if entrada.name.endswith(".listo") and entrada.stat().st_mtime >= limite:
+                    vigentes += 1
+            except FileNotFoundError:
+                continue
+        return vigentes
+
+    def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+        try:
+            os.remove(self._ruta)
+        except FileNotFoundError:
+            pass
+
+
+workers_listos = WorkersListos(settings.READY_DIR)
@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import json
+import math
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional
+import httpx
+from core.config import settings
+from services.cache import crear_cache
+
+# Campos de historia_clinica que se indexan para busqueda de texto libre
+CAMPOS_INDEXADOS = ["motivo", "sintomas_presentes", "tratamiento"]
+
+# Campos que se devuelven junto a cada resultado (sin traer la historia completa)
+CAMPOS_RESUMEN = ["id_historia_clinica", "id_paciente", "id_doctor", "fecha", "motivo"]
+
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "no", "o", "para", "por", "se", "sin", "su", "un", "una", "y",
+}
+
+# Parametros BM25
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    """
+    Normaliza (minusculas, sin tildes) y parte el texto en terminos.
+    """
+    if not texto:
+        return []
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _TOKEN_RE.findall(texto) if t not in STOPWORDS and len(t) > 1]
+
+
+class IndiceHistorias:
+    """
+    Indice invertido en memoria sobre historia_clinica de la sede local.
+    Se llena al arrancar y se actualiza de forma incremental:
+    - create_historia_clinica agrega cada historia nueva apenas se guarda.
+    - sincronizar() trae las historias con id mayor al ultimo indexado
+      (cubre escrituras hechas por otros workers o directamente en la BD).
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)  # termino -> {id_historia: tf}
+        self.longitudes: Dict[int, int] = {}
+        self.terminos_doc: Dict[int, List[str]] = {}  # id_historia -> terminos distintos
+        self.resumenes: Dict[int, dict] = {}
+        self.max_id = 0
+        self.total_terminos = 0
+        self.cargado = False
+        self._ultima_sync = 0.0
+        self._lock = asyncio.Lock()
+
+    def agregar(self, historia: dict):
+        id_historia = historia.get("id_historia_clinica")
+        if id_historia is None:
+            return
+        if id_historia in self.longitudes:
+            self.eliminar(id_historia)
+
+        frecuencias: Dict[str, int] = defaultdict(int)
+        for campo in CAMPOS_INDEXADOS:
+            for termino in tokenizar(historia.get(campo)):
+                frecuencias[termino] += 1
+
+        for termino, tf in frecuencias.items():
+            self.postings[termino][id_historia] = tf
+        self.terminos_doc[id_historia] = list(frecuencias)
+        longitud = sum(frecuencias.values())
+        self.longitudes[id_historia] = longitud
+        self.total_terminos += longitud
+        self.resumenes[id_historia] = {c: historia.get(c) for c in CAMPOS_RESUMEN}
+        self.max_id = max(self.max_id, id_historia)
+
+    def eliminar(self, id_historia: int):
+        longitud = self.longitudes.pop(id_historia, None)
+        if longitud is None:
+            return
+        self.total_terminos -= longitud
+        self.resumenes.pop(id_historia, None)
+        # Solo se tocan los postings de los terminos de este documento
+        for termino in self.terminos_doc.pop(id_historia, ()):
+            docs = self.postings.get(termino)
+            if docs is not None and docs.pop(id_historia, None) is not None and not docs:
+                del self.postings[termino]
+
+    def estadisticas(self, consulta: str) -> dict:
+        """
+        Estadisticas de coleccion para los terminos de la consulta. El gateway las
+        suma entre sedes para que todas puntuen con el mismo IDF y largo promedio.
+        """
+        return {
+            "n": len(self.longitudes),
+            "total_terminos": self.total_terminos,
+            "df": {t: len(self.postings.get(t, ())) for t in set(tokenizar(consulta))},
+        }
+
+    def buscar(self, consulta: str, k: int, globales: Optional[dict] = None) -> List[dict]:
+        """
+        Devuelve los k mejores resultados (BM25) ordenados por score descendente.
+        Con `globales` (suma de estadisticas() de todas las sedes) los scores son
+        comparables entre sedes; sin ellas se usan las estadisticas locales.
+        """
+        if not self.longitudes:
+            return []
+        stats = globales or self.estadisticas(consulta)
+        n = max(stats["n"], 1)
+        promedio = stats["total_terminos"] / n or 1.0
+
+        scores: Dict[int, float] = defaultdict(float)
+        for termino in set(tokenizar(consulta)):
+            docs = self.postings.get(termino)
+            if not docs:
+                continue
+            df = max(stats["df"].get(termino, 0), len(docs))
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for id_historia, tf in docs.items():
+                norma = K1 * (1 - B + B * self.longitudes[id_historia] / promedio)
+                scores[id_historia] += idf * tf * (K1 + 1) / (tf + norma)
+
+        mejores = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [{**self.resumenes[i], "score": round(s, 6)} for i, s in mejores]
+
+    async def sincronizar(self, client: httpx.AsyncClient, forzar: bool = False):
+        """
+        Trae de PostgREST solo las historias nuevas (id > max_id), en paginas de
+        SEARCH_PAGE_SIZE. Se limita a una vez cada SEARCH_SYNC_SECONDS salvo que se fuerce.
+        """
+        ahora = time.monotonic()
+        if not forzar and self.cargado and ahora - self._ultima_sync < settings.SEARCH_SYNC_SECONDS:
+            return
+        async with self._lock:
+            columnas = ",".join(dict.fromkeys(CAMPOS_RESUMEN + CAMPOS_INDEXADOS))
+            try:
+                while True:
+                    params = {
+                        "select": columnas,
+                        "id_historia_clinica": f"gt.{self.max_id}",
+                        "order": "id_historia_clinica.asc",
+                        "limit": str(settings.SEARCH_PAGE_SIZE),
+                    }
+                    resp = await client.get(f"{settings.POSTGREST_URL}/historia_clinica", params=params)
+                    if resp.status_code != 200:
+                        return
+                    pagina = resp.json()
+                    for historia in pagina:
+                        self.agregar(historia)
+                    # Se cede el loop entre paginas para no bloquear otras peticiones
+                    await asyncio.sleep(0)
+                    if len(pagina) < settings.SEARCH_PAGE_SIZE:
+                        break
+                self.cargado = True
+                self._ultima_sync = ahora
+            except Exception as e:
+                print(f"Error sincronizando indice de historias: {e}")
+
+
+indice_historias = IndiceHistorias()
+
+# Resultados globales (ya mezclados) de busquedas recientes
+_cache_busquedas = crear_cache("busqueda", settings.SEARCH_CACHE_MAX_ITEMS)
+# Las claves incluyen esta version; cambiarla invalida todas las busquedas cacheadas.
+# Va en su propia cache, que no se reporta, para no falsear el hit rate de "busqueda".
+_versiones = crear_cache("versiones", 16, reportar=False)
+_VERSION_BUSQUEDAS = "busqueda"
+
+
+async def _version_busquedas() -> str:
+    version = await _versiones.get(_VERSION_BUSQUEDAS)
+    return version.decode() if version else "0"
+
+
+async def invalidar_busquedas():
+    await _versiones.set(_VERSION_BUSQUEDAS, str(time.time_ns()).encode())
+
+
+async def indexar_historia(historia: dict):
+    """
+    Agrega una historia recien escrita al indice local e invalida las busquedas
+    cacheadas, para que aparezca de inmediato.
+    """
+    indice_historias.agregar(historia)
+    await invalidar_busquedas()
+
+
+async def estadisticas_local(consulta: str, client: httpx.AsyncClient) -> dict:
+    await indice_historias.sincronizar(client)
+    return indice_historias.estadisticas(consulta)
+
+
+async def buscar_local(consulta: str, k: int, client: httpx.AsyncClient, globales: Optional[dict] = None) -> List[dict]:
+    await indice_historias.sincronizar(client)
+    return indice_historias.buscar(consulta, k, globales)
+
+
+def sumar_estadisticas(parciales: List[dict]) -> dict:
+    total = {"n": 0, "total_terminos": 0, "df": defaultdict(int)}
+    for stats in parciales:
+        total["n"] += stats.get("n", 0)
+        total["total_terminos"] += stats.get("total_terminos", 0)
+        for termino, df in stats.get("df", {}).items():
+            total["df"][termino] += df
+    total["df"] = dict(total["df"])
+    return total
+
+
+async def buscar_todas_sedes(consulta: str, k: int, client: httpx.AsyncClient) -> List[dict]:
+    """
+    Busca en el indice local y en cada sede (via /internal) en dos fases:
+    1. Cada sede devuelve N, largo total y df de los terminos; se suman.
+    2. Cada sede puntua su top-k con esas estadisticas globales, asi los scores
+       BM25 son comparables y se pueden mezclar en un top-k global.
+    El resultado se cachea SEARCH_CACHE_TTL_SECONDS y se invalida con cada escritura
+    local o evento de una historia nueva en otra sede.
+    """
+    clave = f"{await _version_busquedas()}:{k}:{' '.join(sorted(set(tokenizar(consulta))))}"
+    cacheado = await _cache_busquedas.get_json(clave)
+    if cacheado is not None:
+        return cacheado
+
+    async def estadisticas_sede(sede_url: str):
+        try:
+            url = sede_url.rstrip("/") + "/internal/api/busqueda-estadisticas"
+            response = await client.get(url, params={"q": consulta}, timeout=5.0)
+            if response.status_code == 200:
+                return response.json()
+            return {}
+        except Exception:
+            return {}
+
+    # Fase 1: estadisticas globales
+    parciales_stats = await asyncio.gather(
+        estadisticas_local(consulta, client),
+        *[estadisticas_sede(url) for url in settings.SEDES_URLS],
+    )
+    globales = sumar_estadisticas(parciales_stats)
+
+    # Fase 2: top-k de cada sede puntuado con las estadisticas globales
+    locales = await buscar_local(consulta, k, client, globales)
+    for item in locales:
+        item["sede_origen"] = "local"
+
+    async def buscar_sede(sede_url: str):
+        try:
+            url = sede_url.rstrip("/") + "/internal/api/busqueda-local"
+            params = {"q": consulta, "k": k, "estadisticas": json.dumps(globales)}
+            response = await client.get(url, params=params, timeout=5.0)
+            if response.status_code == 200:
+                data = response.json()
+                for item in data:
+                    if isinstance(item, dict): item["sede_origen"] = sede_url
+                return data
+            return []
+        except Exception:
+            return []
+
+    parciales = [locales]
+    if settings.SEDES_URLS:
+        parciales.extend(await asyncio.gather(*[buscar_sede(url) for url in settings.SEDES_URLS]))
+
+    # Cada lista ya viene ordenada, asi que basta un merge de k elementos
+    merged = heapq.merge(*parciales, key=lambda item: item.get("score", 0), reverse=True)
+    resultado = [item for _, item in zip(range(k), merged)]
+    await _cache_busquedas.set_json(clave, resultado, ttl=settings.SEARCH_CACHE_TTL_SECONDS)
+    return resultado
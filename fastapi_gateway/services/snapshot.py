@@ -0,0 +1,207 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import httpx
+from core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos, cada worker actualiza
+    fcntl = None
+
+# Tabla -> (clave primaria, columnas que se copian al snapshot)
+TABLAS_SNAPSHOT: Dict[str, tuple] = {
+    "historia_clinica": ("id_historia_clinica", ["id_paciente", "id_doctor", "fecha", "edad", "motivo"]),
+    "examenes": ("id_examen", ["id_historia_clinica", "nombre_examen", "resultado", "fecha_registro"]),
+    "enfermedades": ("id_enfermedad", ["id_historia_clinica", "codigo", "enfermedad"]),
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS historia_clinica (
+    sede TEXT NOT NULL, id_historia_clinica INTEGER NOT NULL,
+    id_paciente INTEGER, id_doctor INTEGER, fecha TEXT, edad INTEGER, motivo TEXT,
+    PRIMARY KEY (sede, id_historia_clinica)
+);
+CREATE TABLE IF NOT EXISTS examenes (
+    sede TEXT NOT NULL, id_examen INTEGER NOT NULL,
+    id_historia_clinica INTEGER, nombre_examen TEXT, resultado REAL, fecha_registro TEXT,
+    PRIMARY KEY (sede, id_examen)
+);
+CREATE TABLE IF NOT EXISTS enfermedades (
+    sede TEXT NOT NULL, id_enfermedad INTEGER NOT NULL,
+    id_historia_clinica INTEGER, codigo TEXT, enfermedad TEXT,
+    PRIMARY KEY (sede, id_enfermedad)
+);
+CREATE TABLE IF NOT EXISTS marcas (
+    sede TEXT NOT NULL, tabla TEXT NOT NULL, max_id INTEGER NOT NULL,
+    PRIMARY KEY (sede, tabla)
+);
+CREATE TABLE IF NOT EXISTS estado (
+    clave TEXT PRIMARY KEY, valor REAL
+);
+CREATE INDEX IF NOT EXISTS idx_snap_historia_fecha ON historia_clinica(fecha);
+CREATE INDEX IF NOT EXISTS idx_snap_examenes_fecha ON examenes(fecha_registro);
+"""
+
+
+class SnapshotAnalitico:
+    """
+    Copia local (SQLite) de las tablas clinicas de todas las sedes para reportes.
+    Se actualiza en segundo plano trayendo solo filas con id mayor a la ultima
+    marca de cada sede/tabla, asi los reportes nunca tocan PostgREST en vivo.
+    Todos los workers del pod comparten el archivo: solo el que obtiene el lock
+    (`ruta`.lock) corre el bucle de actualizacion, el resto solo lee.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.ultima_actualizacion: Optional[float] = None
+        self.actualizador = False
+        self._archivo_lock = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._esquema_listo = False
+
+    @contextmanager
+    def _conectar(self):
+        # Una conexion por operacion: se usa desde hilos distintos (asyncio.to_thread)
+        conn = sqlite3.connect(self.ruta, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._esquema_listo:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(ESQUEMA)
+                self._esquema_listo = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Lectura ---
+    def _consultar(self, sql: str, params: tuple) -> List[dict]:
+        with self._conectar() as conn:
+            return [dict(r) for r in conn.execute(sql, params)]
+
+    async def consultar(self, sql: str, params: tuple = ()) -> List[dict]:
+        return await asyncio.to_thread(self._consultar, sql, params)
+
+    def _marcas(self) -> Dict[tuple, int]:
+        with self._conectar() as conn:
+            return {(r["sede"], r["tabla"]): r["max_id"] for r in conn.execute("SELECT * FROM marcas")}
+
+    async def leer_ultima_actualizacion(self) -> Optional[float]:
+        """Hora de la ultima actualizacion hecha por cualquier worker del pod."""
+        filas = await self.consultar("SELECT valor FROM estado WHERE clave = 'ultima_actualizacion'")
+        return filas[0]["valor"] if filas else self.ultima_actualizacion
+
+    # --- Escritura ---
+    def _guardar(self, sede: str, tabla: str, filas: List[dict]):
+        pk, columnas = TABLAS_SNAPSHOT[tabla]
+        todas = ["sede", pk] + columnas
+        sql = f"INSERT OR REPLACE INTO {tabla} ({', '.join(todas)}) VALUES ({', '.join('?' * len(todas))})"
+        max_id = max(f[pk] for f in filas)
+        with self._conectar() as conn:
+            conn.executemany(sql, [(sede, f[pk], *(f.get(c) for c in columnas)) for f in filas])
+            conn.execute(
+                "INSERT INTO marcas (sede, tabla, max_id) VALUES (?, ?, ?) "
+                "ON CONFLICT(sede, tabla) DO UPDATE SET max_id = MAX(max_id, excluded.max_id)",
+                (sede, tabla, max_id),
+            )
+        return max_id
+
+    async def _traer_tabla(self, sede: str, url_base: str, tabla: str, desde: int, client: httpx.AsyncClient) -> int:
+        pk, columnas = TABLAS_SNAPSHOT[tabla]
+        nuevas = 0
+        while True:
+            params = {
+                "select": ",".join([pk] + columnas),
+                pk: f"gt.{desde}",
+                "order": f"{pk}.asc",
+                "limit": str(settings.SNAPSHOT_PAGE_SIZE),
+            }
+            resp = await client.get(f"{url_base}/{tabla}", params=params, timeout=30.0)
+            if resp.status_code != 200:
+                break
+            filas = [f for f in resp.json() if isinstance(f, dict) and pk in f]
+            if not filas:
+                break
+            desde = await asyncio.to_thread(self._guardar, sede, tabla, filas)
+            nuevas += len(filas)
+            if len(filas) < settings.SNAPSHOT_PAGE_SIZE:
+                break
+        return nuevas
+
+    async def actualizar(self, client: httpx.AsyncClient) -> Dict[str, int]:
+        """
+        Trae las filas nuevas de cada sede. Local via PostgREST, remotas via /internal.
+        """
+        async with self._lock:
+            marcas = await asyncio.to_thread(self._marcas)
+            origenes = {"local": settings.POSTGREST_URL}
+            for sede_url in settings.SEDES_URLS:
+                origenes[sede_url] = sede_url.rstrip("/") + "/internal/api/consulta-local"
+
+            async def traer_sede(sede: str, url_base: str):
+                total = 0
+                for tabla in TABLAS_SNAPSHOT:
+                    try:
+                        total += await self._traer_tabla(sede, url_base, tabla, marcas.get((sede, tabla), 0), client)
+                    except Exception as e:
+                        print(f"Error en snapshot {sede}/{tabla}: {e}")
+                return total
+
+            totales = await asyncio.gather(*[traer_sede(s, u) for s, u in origenes.items()])
+            self.ultima_actualizacion = time.time()
+            await asyncio.to_thread(self._guardar_estado, self.ultima_actualizacion)
+            return dict(zip(origenes, totales))
+
+    def _guardar_estado(self, ultima: float):
+        with self._conectar() as conn:
+            conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('ultima_actualizacion', ?)", (ultima,))
+
+    async def _bucle(self, client: httpx.AsyncClient):
+        while True:
+            try:
+                await self.actualizar(client)
+            except Exception as e:
+                print(f"Error actualizando snapshot: {e}")
+            await asyncio.sleep(settings.SNAPSHOT_INTERVAL_SECONDS)
+
+    def _tomar_lock(self) -> bool:
+        """
+        Lock exclusivo no bloqueante sobre `ruta`.lock. El sistema operativo lo
+        libera si el proceso muere, asi otro worker puede tomarlo al reiniciar.
+        """
+        if fcntl is None:
+            return True
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        archivo = open(self.ruta + ".lock", "w")
+        try:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._archivo_lock = archivo
+        return True
+
+    def iniciar(self, client: httpx.AsyncClient):
+        self.actualizador = self._tomar_lock()
+        if self.actualizador:
+            self._tarea = asyncio.create_task(self._bucle(client))
+
+    def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+        if self._archivo_lock:
+            self._archivo_lock.close()
+            self._archivo_lock = None
+        self.actualizador = False
+
+
+snapshot = SnapshotAnalitico(settings.SNAPSHOT_DB_PATH)
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+import httpx
+from fastapi import HTTPException
+from core.config import settings
+
+RPC_REGISTRAR = "rpc/registrar_consultas"
+
+# Si la BD aun no tiene la migracion 001, se vuelve a probar el RPC cada tanto
+REINTENTO_RPC_SEGUNDOS = 60
+
+
+def hash_consulta(consulta: dict) -> str:
+    """Huella del contenido de la consulta que se guarda junto a la Idempotency-Key."""
+    contenido = json.dumps(consulta, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def _conflicto_clave() -> HTTPException:
+    return HTTPException(status_code=409, detail="Idempotency-Key ya usada con un contenido distinto")
+
+
+def _resultado_incierto(e: Exception) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Sin respuesta de la BD, la escritura pudo haberse guardado ({e}). Reintente con Idempotency-Key",
+    )
+
+
+class _SinRpc(Exception):
+    """La BD no tiene rpc/registrar_consultas (migracion 001 sin aplicar)."""
+
+
+class PipelineEscritura:
+    """
+    Agrupa las consultas (historia + examenes + procedimientos) que llegan en una
+    ventana corta y las envia en una sola llamada RPC transaccional a PostgREST.
+    La idempotencia se garantiza en la BD (tabla idempotencia); aqui ademas se
+    comparten los reintentos simultaneos con la misma clave.
+    """
+
+    def __init__(self):
+        self._pendientes: List[Tuple[dict, asyncio.Future]] = []
+        self._en_curso: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._temporizador: Optional[asyncio.Task] = None
+        self._vaciados: Set[asyncio.Task] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sin_rpc_hasta = 0.0
+
+    async def registrar(self, consulta: dict, client: httpx.AsyncClient, clave: Optional[str] = None) -> dict:
+        huella = None
+        if clave:
+            huella = hash_consulta(consulta)
+            if clave in self._en_curso:
+                huella_previa, previo = self._en_curso[clave]
+                if huella_previa != huella:
+                    raise _conflicto_clave()
+                # Otra peticion con la misma clave ya esta escribiendo: esta es un reintento
+                return {**await asyncio.shield(previo), "repetida": True}
+
+        futuro = asyncio.get_running_loop().create_future()
+        if clave:
+            consulta = {**consulta, "clave": clave, "hash": huella}
+            self._en_curso[clave] = (huella, futuro)
+            futuro.add_done_callback(lambda _: self._en_curso.pop(clave, None))
+
+        self._client = client
+        self._pendientes.append((consulta, futuro))
+        if len(self._pendientes) >= settings.WRITE_BATCH_MAX:
+            # El lote se envia en su propia tarea: si este cliente se desconecta,
+            # la cancelacion no alcanza a las demas peticiones del lote.
+            tarea = asyncio.create_task(self._vaciar())
+            self._vaciados.add(tarea)
+            tarea.add_done_callback(self._vaciados.discard)
+        elif self._temporizador is None:
+            self._temporizador = asyncio.create_task(self._vaciar_tras_ventana())
+
+        return await asyncio.shield(futuro)
+
+    async def _vaciar_tras_ventana(self):
+        await asyncio.sleep(settings.WRITE_BATCH_WINDOW_MS / 1000)
+        self._temporizador = None
+        await self._vaciar()
+
+    async def _vaciar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return
+
+        try:
+            if len(lote) > 1 and time.monotonic() < self._sin_rpc_hasta:
+                # Sin RPC no hay transaccion de lote: cada consulta se escribe por separado
+                await asyncio.gather(*[self._enviar_individual(item) for item in lote])
+                return
+            try:
+                resultados = await self._enviar([c for c, _ in lote])
+            except _SinRpc:
+                await asyncio.gather(*[self._enviar_individual(item) for item in lote])
+                return
+            except httpx.HTTPError as e:
+                # PostgREST no respondio: la transaccion pudo haberse confirmado. Reintentar
+                # de a una duplicaria las consultas sin Idempotency-Key, asi que el lote falla.
+                self._resolver(lote, error=_resultado_incierto(e))
+                return
+            except HTTPException as e:
+                if len(lote) == 1:
+                    self._resolver(lote, error=e)
+                    return
+                # PostgREST respondio con error, asi que la transaccion se revirtio:
+                # reintentamos de a una para que cada peticion reciba su propio resultado o error.
+                await asyncio.gather(*[self._enviar_individual(item) for item in lote])
+                return
+            except Exception as e:
+                self._resolver(lote, error=HTTPException(status_code=500, detail=f"Error en escritura por lote: {e}"))
+                return
+            self._resolver(lote, resultados=resultados)
+        finally:
+            # Ninguna peticion queda esperando para siempre (p. ej. si esta tarea se cancela
+            # en el apagado). Con Idempotency-Key el cliente puede reintentar sin duplicar.
+            self._resolver(lote, error=HTTPException(status_code=503, detail="Escritura interrumpida, reintente"))
+
+    async def _enviar_individual(self, item: Tuple[dict, asyncio.Future]):
+        try:
+            try:
+                resultados = await self._enviar([item[0]])
+            except _SinRpc:
+                resultados = [await self._enviar_directo(item[0])]
+            self._resolver([item], resultados=resultados)
+        except httpx.HTTPError as e:
+            self._resolver([item], error=_resultado_incierto(e))
+        except HTTPException as e:
+            self._resolver([item], error=e)
+        except Exception as e:
+            self._resolver([item], error=HTTPException(status_code=500, detail=f"Error en escritura: {e}"))
+
+    async def _enviar(self, consultas: List[dict]) -> List[dict]:
+        """
+        Envia las consultas en una transaccion. Los errores de transporte (httpx.HTTPError)
+        se propagan tal cual: el llamador no puede saber si la transaccion se confirmo.
+        Lanza _SinRpc si la BD no tiene el RPC.
+        """
+        if time.monotonic() < self._sin_rpc_hasta:
+            raise _SinRpc()
+        resp = await self._client.post(
+            f"{settings.POSTGREST_URL}/{RPC_REGISTRAR}",
+            json={"consultas": consultas},
+        )
+        if resp.status_code == 404:
+            print("⚠️ rpc/registrar_consultas no existe: aplique data/postgres/migrations/001_registrar_consultas.sql. "
+                  "Mientras tanto se escribe sin lote ni idempotencia.")
+            self._sin_rpc_hasta = time.monotonic() + REINTENTO_RPC_SEGUNDOS
+            raise _SinRpc()
+        if resp.status_code != 200:
+            raise HTTPException(status_code=resp.status_code, detail=f"Error: {resp.text}")
+        return resp.json()
+
+    async def _post(self, tabla: str, data) -> list:
+        try:
+            resp = await self._client.post(
+                f"{settings.POSTGREST_URL}/{tabla}", json=data, headers={"Prefer": "return=representation"}
+            )
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Error conectando con la BD: {e}")
+        if resp.status_code != 201:
+            raise HTTPException(status_code=resp.status_code, detail=f"Error: {resp.text}")
+        return resp.json()
+
+    async def _enviar_directo(self, consulta: dict) -> dict:
+        """
+        Escritura sin el RPC (BD sin migrar): un POST por tabla, como antes.
+        No es transaccional ni idempotente.
+        """
+        historia = (await self._post("historia_clinica", consulta["historia"]))[0]
+        creada = {"historia": historia, "examenes": [], "procedimientos": []}
+        ahora = datetime.now().isoformat()
+        for tabla in ("examenes", "procedimientos"):
+            filas = [
+                {**f, "id_historia_clinica": historia["id_historia_clinica"], "fecha_registro": f.get("fecha_registro") or ahora}
+                for f in consulta.get(tabla) or []
+            ]
+            if filas:
+                creada[tabla] = await self._post(tabla, filas)
+        return creada
+
+    @staticmethod
+    def _resolver(lote, resultados: Optional[List[dict]] = None, error: Optional[Exception] = None):
+        for i, (_, futuro) in enumerate(lote):
+            if futuro.done():
+                continue
+            if error is not None:
+                futuro.set_exception(error)
+            elif resultados[i].get("conflicto_clave"):
+                futuro.set_exception(_conflicto_clave())
+            else:
+                futuro.set_result(resultados[i])
+
+
+pipeline_escritura = PipelineEscritura()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los modulos del gateway se importan desde la raiz (ej: `from services import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
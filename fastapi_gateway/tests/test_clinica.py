@@ -0,0 +1,67 @@
+import asyncio
+import io
+import zipfile
+
+from routers import clinica
+from schemas import ConsultaCreate, HistoriaClinicaCreate, PdfLoteRequest
+
+
+def test_reintento_idempotente_no_publica_ni_reindexa(monkeypatch):
+    publicados, indexados = [], []
+    respuesta = {"historia": {"id_historia_clinica": 5, "id_paciente": 1}, "examenes": [{"id_examen": 1}]}
+
+    async def registrar(consulta, client, clave):
+        return {**respuesta, "repetida": True}
+
+    monkeypatch.setattr(clinica.pipeline_escritura, "registrar", registrar)
+    async def publicar(evento, client):
+        publicados.append(evento)
+
+    monkeypatch.setattr(clinica.bus_eventos, "publicar", publicar)
+    async def indexar(historia):
+        indexados.append(historia)
+
+    monkeypatch.setattr(clinica, "indexar_historia", indexar)
+
+    historia = HistoriaClinicaCreate(id_paciente=1, id_doctor=1, fecha="2024-01-01", motivo="fiebre", edad=30)
+    creada = asyncio.run(clinica._registrar_consulta(ConsultaCreate(historia=historia), None, "clave-1"))
+
+    assert creada["repetida"]
+    assert publicados == [] and indexados == []
+
+
+def test_lote_pdf_lista_errores_sin_cortar_el_zip(monkeypatch):
+    consultas = []
+
+    async def query(tabla, params, client):
+        consultas.append((tabla, params))
+        if tabla == "historia_clinica":
+            return [{"id_historia_clinica": i, "id_paciente": 1, "id_doctor": 1} for i in (1, 2)]
+        if tabla == "pacientes":
+            return [{"id_paciente": 1, "nombres": "Ana", "apellidos": "Diaz", "cedula": "1"}]
+        return [{"id_doctor": 1, "nombres": "Luis", "apellidos": "Mora"}]
+
+    async def generar(historia, paciente, doctor):
+        if historia["id_historia_clinica"] == 2:
+            raise RuntimeError("render fallido")
+        return b"%PDF"
+
+    monkeypatch.setattr(clinica, "query_all_sedes", query)
+    monkeypatch.setattr(clinica, "generar_pdf", generar)
+    monkeypatch.setattr(clinica.directorio.doctores, "obtener", lambda i: None)
+
+    async def main():
+        respuesta = await clinica.descargar_lote_pdf(PdfLoteRequest(ids_historia=[1, 2, 3]), None)
+        return b"".join([parte async for parte in respuesta.body_iterator])
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(main()))) as zf:
+        assert sorted(zf.namelist()) == ["errores.txt", "historia_1.pdf", "no_encontradas.txt"]
+        assert zf.read("no_encontradas.txt") == b"3\n"
+        assert zf.read("errores.txt").startswith(b"2: render fallido")
+
+    # Una consulta por tabla para todo el lote
+    assert consultas == [
+        ("historia_clinica", {"id_historia_clinica": "in.(1,2,3)"}),
+        ("pacientes", {"id_paciente": "in.(1)"}),
+        ("doctores", {"id_doctor": "in.(1)"}),
+    ]
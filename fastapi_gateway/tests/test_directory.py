@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import httpx
+
+from core.config import settings
+from services.directory import Directorio
+
+
+def test_copia_compartida_conserva_su_antiguedad():
+    directorio = Directorio()
+
+    async def main():
+        hace = time.time() - (settings.DIRECTORY_FULL_SYNC_SECONDS - 1)
+        for tabla in directorio.tablas:
+            await directorio._cache.set_json(tabla.tabla, {"cargado_en": hace, "registros": []})
+        return await directorio._desde_cache()
+
+    assert asyncio.run(main())
+    # Le queda ~1 s antes de la proxima carga completa, no un intervalo entero
+    for tabla in directorio.tablas:
+        restante = settings.DIRECTORY_FULL_SYNC_SECONDS - (time.monotonic() - tabla.ultima_carga_completa)
+        assert restante < 5
+
+
+def test_refresco_forzado_llega_a_los_demas_workers(monkeypatch):
+    monkeypatch.setattr(settings, "DIRECTORY_SYNC_SECONDS", 0)
+    doctores = [{"id_doctor": 1, "nombres": "Ana"}]
+
+    def responder(request):
+        if request.url.path.endswith("/doctores"):
+            return httpx.Response(200, json=doctores)
+        return httpx.Response(200, json=[])
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(responder))
+        worker_a, worker_b = Directorio(), Directorio()
+        await worker_b.iniciar(client)
+        worker_b.detener()
+        # Cambio que la sincronizacion incremental (id > max_id) no ve
+        doctores[0] = {"id_doctor": 1, "nombres": "Ana Maria"}
+        await worker_a.refrescar(client)
+        worker_b._tarea = asyncio.create_task(worker_b._bucle(client))
+        await asyncio.sleep(0.05)
+        worker_b.detener()
+        await client.aclose()
+        return worker_b.doctores.obtener(1)
+
+    assert asyncio.run(main())["nombres"] == "Ana Maria"
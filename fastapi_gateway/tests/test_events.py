@@ -0,0 +1,73 @@
+import asyncio
+
+import redis.asyncio
+
+from core.config import settings
+from services.events import BusEventos
+
+
+class _RedisCompartido:
+    """Redis minimo en memoria: incr y pub/sub entre los clientes que lo comparten."""
+
+    def __init__(self):
+        self.contador = 0
+        self.colas = []
+
+    def cliente(self, url):
+        return _ClienteRedis(self)
+
+
+class _ClienteRedis:
+    def __init__(self, servidor):
+        self.servidor = servidor
+
+    async def incr(self, clave):
+        self.servidor.contador += 1
+        return self.servidor.contador
+
+    async def publish(self, canal, data):
+        for cola in self.servidor.colas:
+            cola.put_nowait({"type": "message", "data": data})
+
+    def pubsub(self):
+        return _PubSub(self.servidor)
+
+    async def aclose(self):
+        pass
+
+
+class _PubSub:
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.cola = asyncio.Queue()
+
+    async def subscribe(self, canal):
+        self.servidor.colas.append(self.cola)
+
+    async def listen(self):
+        while True:
+            yield await self.cola.get()
+
+    async def aclose(self):
+        self.servidor.colas.remove(self.cola)
+
+
+def test_evento_escrito_en_un_worker_llega_a_los_suscriptores_de_otro(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_BACKEND", "redis")
+    monkeypatch.setattr(settings, "SEDES_URLS", [])
+    monkeypatch.setattr(redis.asyncio, "from_url", _RedisCompartido().cliente)
+
+    async def main():
+        worker_a, worker_b = BusEventos(), BusEventos()
+        worker_a.iniciar()
+        worker_b.iniciar()
+        await asyncio.sleep(0)  # los dos workers ya escuchan el canal
+        cola = worker_b.suscribir([7])
+        await worker_a.publicar({"tipo": "historia_clinica", "id_paciente": 7, "datos": {}}, None)
+        evento = await asyncio.wait_for(cola.get(), timeout=1.0)
+        await worker_a.detener()
+        await worker_b.detener()
+        return evento
+
+    evento = asyncio.run(main())
+    assert evento["id"] == 1 and evento["sede_origen"] == "local"
@@ -0,0 +1,49 @@
+import math
+
+from services.lab_analytics import analizar_examenes
+
+
+def _hb(resultado, fecha):
+    return {"nombre_examen": "hb", "resultado": resultado, "valor_bajo": 12.2, "valor_alto": 13.5, "fecha_registro": fecha}
+
+
+EXAMENES = [
+    _hb(12.5, None),
+    _hb(13.1, "2024-01-05T08:00:00"),
+    _hb(12.0, "2024-01-01T08:00:00"),
+    _hb(14.0, "2024-01-03T08:00:00"),
+    _hb(None, "2024-01-04T08:00:00"),
+    {"nombre_examen": "glucosa", "resultado": 90, "fecha_registro": "2024-01-02T08:00:00"},
+]
+
+
+def test_resumen_por_examen():
+    resumen = {r["nombre_examen"]: r for r in analizar_examenes(EXAMENES)["resumen"]}
+    hb = resumen["hb"]
+    assert hb["n"] == 4
+    assert hb["media"] == 12.9
+    assert hb["desviacion"] == 0.745
+    assert (hb["minimo"], hb["maximo"]) == (12.0, 14.0)
+    # El resultado sin fecha no es el "ultimo": gana el mas reciente con fecha
+    assert hb["ultimo"] == 13.1
+    # Minimos cuadrados sobre (0 d, 12.0), (2 d, 14.0), (4 d, 13.1); NaN y NaT no cuentan
+    assert hb["tendencia_por_dia"] == 0.275
+    assert hb["fuera_de_rango"] == 2
+    assert resumen["glucosa"]["desviacion"] == 0.0 and resumen["glucosa"]["tendencia_por_dia"] is None
+
+
+def test_filas_con_estado_z_score_y_media_movil():
+    filas = [f for f in analizar_examenes(EXAMENES, ventana=3)["examenes"] if f["nombre_examen"] == "hb"]
+    # Orden cronologico, las filas sin fecha al final del grupo
+    assert [f["resultado"] for f in filas][:2] == [12.0, 14.0]
+    assert filas[2]["resultado"] is None and filas[4]["fecha_registro"] is None
+    assert [f["estado"] for f in filas] == ["bajo", "alto", "sin_dato", "normal", "normal"]
+    assert [f["z_score"] for f in filas] == [-1.2081, 1.4765, None, 0.2685, -0.5369]
+    assert [f["media_movil"] for f in filas] == [12.0, 13.0, 13.0, 13.55, 12.8]
+
+
+def test_grupo_solo_sin_fechas_usa_el_ultimo_valido():
+    resumen = analizar_examenes([_hb(12.5, None), _hb(13.0, None)])["resumen"][0]
+    assert resumen["ultimo"] == 13.0
+    assert resumen["tendencia_por_dia"] is None
+    assert math.isclose(resumen["media"], 12.75)
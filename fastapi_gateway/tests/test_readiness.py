@@ -0,0 +1,23 @@
+import asyncio
+import os
+import time
+
+from services.readiness import WorkersListos
+
+
+def test_solo_cuenta_las_marcas_vigentes(tmp_path):
+    listos = WorkersListos(str(tmp_path))
+    # Marca de un worker que murio hace rato sin borrarla
+    caida = tmp_path / "999999.listo"
+    caida.touch()
+    viejo = time.time() - 3600
+    os.utime(caida, (viejo, viejo))
+
+    async def main():
+        antes = listos.contar()
+        listos.marcar()
+        despues = listos.contar()
+        listos.detener()
+        return antes, despues, listos.contar()
+
+    assert asyncio.run(main()) == (0, 1, 0)
@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+
+from services import search
+from services.cache import MemoriaLRU
+
+
+def test_busqueda_cacheada_se_invalida_al_indexar_historia_local(monkeypatch):
+    monkeypatch.setattr(search.settings, "SEDES_URLS", [])
+    indice = search.IndiceHistorias()
+    indice.cargado = True
+    indice._ultima_sync = float("inf")  # sin sincronizar contra PostgREST
+    monkeypatch.setattr(search, "indice_historias", indice)
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(500)))
+        antes = await search.buscar_todas_sedes("fiebre", 5, client)
+        await search.indexar_historia({"id_historia_clinica": 1, "motivo": "Fiebre alta"})
+        despues = await search.buscar_todas_sedes("fiebre", 5, client)
+        await client.aclose()
+        return antes, despues
+
+    antes, despues = asyncio.run(main())
+    assert antes == []
+    assert [h["id_historia_clinica"] for h in despues] == [1]
+
+
+def test_hit_rate_de_busquedas_no_cuenta_la_clave_de_version(monkeypatch):
+    monkeypatch.setattr(search.settings, "SEDES_URLS", [])
+    indice = search.IndiceHistorias()
+    indice.cargado = True
+    indice._ultima_sync = float("inf")
+    monkeypatch.setattr(search, "indice_historias", indice)
+    cache = MemoriaLRU("busqueda", 10)
+    monkeypatch.setattr(search, "_cache_busquedas", cache)
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(500)))
+        for _ in range(10):
+            await search.buscar_todas_sedes("fiebre", 5, client)
+        await client.aclose()
+        return await cache.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["hits"], stats["misses"]) == (9, 1)
+
+
+def test_scores_con_estadisticas_globales_son_comparables_entre_sedes():
+    # Sede chica: "fiebre" aparece en su unica historia (IDF local bajo pero sin competencia).
+    chica = search.IndiceHistorias()
+    chica.agregar({"id_historia_clinica": 1, "motivo": "fiebre"})
+    # Sede grande: "fiebre" es rara, deberia pesar mas.
+    grande = search.IndiceHistorias()
+    grande.agregar({"id_historia_clinica": 1, "motivo": "fiebre"})
+    for i in range(2, 50):
+        grande.agregar({"id_historia_clinica": i, "motivo": f"control rutina {i}"})
+
+    globales = search.sumar_estadisticas([chica.estadisticas("fiebre"), grande.estadisticas("fiebre")])
+    assert globales["n"] == 50 and globales["df"] == {"fiebre": 2}
+
+    # Mismo documento, mismas estadisticas globales -> mismo score en ambas sedes
+    assert chica.buscar("fiebre", 1, globales)[0]["score"] == grande.buscar("fiebre", 1, globales)[0]["score"]
+
+
+def test_eliminar_solo_toca_los_terminos_del_documento():
+    indice = search.IndiceHistorias()
+    indice.agregar({"id_historia_clinica": 1, "motivo": "fiebre alta", "tratamiento": "reposo"})
+    indice.agregar({"id_historia_clinica": 2, "motivo": "fiebre"})
+    indice.eliminar(1)
+    assert dict(indice.postings) == {"fiebre": {2: 1}}
+    assert indice.total_terminos == 1 and 1 not in indice.terminos_doc
+
+
+def test_sincronizar_pagina_con_limit(monkeypatch):
+    monkeypatch.setattr(search.settings, "SEARCH_PAGE_SIZE", 2)
+    historias = [{"id_historia_clinica": i, "motivo": f"control {i}"} for i in range(1, 6)]
+    pedidos = []
+
+    def responder(request):
+        desde = int(request.url.params["id_historia_clinica"].removeprefix("gt."))
+        limite = int(request.url.params["limit"])
+        pedidos.append(desde)
+        return httpx.Response(200, json=[h for h in historias if h["id_historia_clinica"] > desde][:limite])
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(responder))
+        indice = search.IndiceHistorias()
+        await indice.sincronizar(client, forzar=True)
+        await client.aclose()
+        return indice
+
+    indice = asyncio.run(main())
+    assert pedidos == [0, 2, 4]
+    assert indice.max_id == 5 and indice.cargado
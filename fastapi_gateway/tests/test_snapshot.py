@@ -0,0 +1,27 @@
+import asyncio
+
+import httpx
+
+from services.snapshot import SnapshotAnalitico
+
+
+def test_solo_un_worker_actualiza_el_snapshot(tmp_path):
+    ruta = str(tmp_path / "snapshot.db")
+    primero, segundo = SnapshotAnalitico(ruta), SnapshotAnalitico(ruta)
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(200, json=[])))
+        primero.iniciar(client)
+        segundo.iniciar(client)
+        estado = (primero.actualizador, segundo.actualizador, segundo._tarea)
+        await primero.actualizar(client)
+        # El lector ve la hora de actualizacion escrita por el otro worker
+        ultima = await segundo.leer_ultima_actualizacion()
+        primero.detener()
+        segundo.detener()
+        await client.aclose()
+        return estado, ultima
+
+    (uno, dos, tarea_lector), ultima = asyncio.run(main())
+    assert uno and not dos and tarea_lector is None
+    assert ultima == primero.ultima_actualizacion
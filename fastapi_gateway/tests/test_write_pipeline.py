@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import HTTPException
+
+from core.config import settings
+from services.write_pipeline import PipelineEscritura
+
+
+def _consulta(motivo: str) -> dict:
+    return {"historia": {"id_paciente": 1, "motivo": motivo}, "examenes": [], "procedimientos": []}
+
+
+def test_cancelar_peticion_que_llena_el_lote_no_bloquea_a_las_demas(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_BATCH_MAX", 3)
+    monkeypatch.setattr(settings, "WRITE_BATCH_WINDOW_MS", 10_000)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.05)
+        consultas = json.loads(request.content)["consultas"]
+        return httpx.Response(200, json=[
+            {"historia": {**c["historia"], "id_historia_clinica": i}, "examenes": [], "procedimientos": []}
+            for i, c in enumerate(consultas, 1)
+        ])
+
+    async def main():
+        pipeline = PipelineEscritura()
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        primeras = [asyncio.create_task(pipeline.registrar(_consulta(f"m{i}"), client)) for i in range(2)]
+        await asyncio.sleep(0)
+        tercera = asyncio.create_task(pipeline.registrar(_consulta("m2"), client))
+        await asyncio.sleep(0.01)  # el RPC del lote ya esta en vuelo
+        tercera.cancel()
+        resultados = await asyncio.wait_for(asyncio.gather(*primeras), timeout=1.0)
+        await client.aclose()
+        return resultados
+
+    resultados = asyncio.run(main())
+    assert [r["historia"]["id_historia_clinica"] for r in resultados] == [1, 2]
+
+
+def test_timeout_tras_confirmar_el_lote_no_reintenta_de_a_una(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_BATCH_MAX", 2)
+    filas = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        # La BD confirma la transaccion pero la respuesta nunca llega
+        filas.extend(json.loads(request.content)["consultas"])
+        raise httpx.ReadTimeout("timeout", request=request)
+
+    async def main():
+        pipeline = PipelineEscritura()
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        resultados = await asyncio.gather(
+            *[pipeline.registrar(_consulta(f"m{i}"), client) for i in range(2)], return_exceptions=True
+        )
+        await client.aclose()
+        return resultados
+
+    resultados = asyncio.run(main())
+    assert len(filas) == 2
+    assert [r.status_code for r in resultados] == [503, 503]
+
+
+def test_sin_rpc_escribe_directo_en_las_tablas():
+    # BD sin la migracion 001: PostgREST responde 404 al RPC
+    llamadas = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        tabla = request.url.path.rsplit("/", 1)[-1]
+        llamadas.append(tabla)
+        if tabla == "registrar_consultas":
+            return httpx.Response(404, json={"code": "PGRST202"})
+        body = json.loads(request.content)
+        if tabla == "historia_clinica":
+            return httpx.Response(201, json=[{**body, "id_historia_clinica": 7}])
+        return httpx.Response(201, json=body)
+
+    async def main():
+        pipeline = PipelineEscritura()
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        consulta = _consulta("fiebre")
+        consulta["examenes"] = [{"nombre_examen": "glucosa", "resultado": 90, "fecha_registro": None}]
+        creada = await pipeline.registrar(consulta, client)
+        await client.aclose()
+        return creada
+
+    creada = asyncio.run(main())
+    assert llamadas == ["registrar_consultas", "historia_clinica", "examenes"]
+    assert creada["historia"]["id_historia_clinica"] == 7
+    assert creada["examenes"][0]["id_historia_clinica"] == 7
+    assert creada["examenes"][0]["fecha_registro"]
+
+
+def test_clave_reutilizada_con_otro_contenido_es_conflicto():
+    guardadas = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        salida = []
+        for c in json.loads(request.content)["consultas"]:
+            previa = guardadas.get(c["clave"])
+            if previa is None:
+                guardadas[c["clave"]] = (c["hash"], {"historia": {**c["historia"], "id_historia_clinica": 1}})
+                salida.append(guardadas[c["clave"]][1])
+            elif previa[0] == c["hash"]:
+                salida.append({**previa[1], "repetida": True})
+            else:
+                salida.append({"conflicto_clave": True})
+        return httpx.Response(200, json=salida)
+
+    async def main():
+        pipeline = PipelineEscritura()
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        primera = await pipeline.registrar(_consulta("fiebre"), client, "clave-1")
+        repetida = await pipeline.registrar(_consulta("fiebre"), client, "clave-1")
+        try:
+            await pipeline.registrar(_consulta("otro paciente"), client, "clave-1")
+            estado = None
+        except HTTPException as e:
+            estado = e.status_code
+        await client.aclose()
+        return primera, repetida, estado
+
+    primera, repetida, estado = asyncio.run(main())
+    assert repetida["historia"] == primera["historia"]
+    assert repetida["repetida"] and not primera.get("repetida")
+    assert estado == 409